@@ -0,0 +1,142 @@
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.security.Permission;
+import java.util.jar.JarFile;
+
+/**
+ * Long-lived ACTS worker used by RestCT (src/generator.py).
+ *
+ * Run with the source launcher of Java 11+: java -cp acts.jar lib/ActsWorker.java acts.jar
+ *
+ * ACTS may call System.exit when it finishes, which is trapped by a SecurityManager. JDKs which do not allow
+ * installing one (18+) are rejected when the worker starts, and RestCT calls ACTS for each covering array instead.
+ *
+ * Protocol (one request at a time, lengths are counted in bytes of utf-8):
+ *   PING                          -> PONG
+ *   REQ strength length\n model   -> OK length\n csv | ERR message
+ *   EXIT                          -> the worker stops
+ * If the worker cannot start, it answers ERR message to the first request and stops.
+ */
+public class ActsWorker {
+
+    static class ExitTrappedException extends SecurityException {
+    }
+
+    public static void main(String[] args) throws Exception {
+        InputStream in = new BufferedInputStream(System.in);
+        OutputStream out = new BufferedOutputStream(new FileOutputStream(FileDescriptor.out));
+
+        String trapError = trapExit();
+        if (trapError != null) {
+            readLine(in);
+            send(out, "ERR cannot trap System.exit of acts: " + trapError);
+            return;
+        }
+
+        String mainClass;
+        try (JarFile jar = new JarFile(args[0])) {
+            mainClass = jar.getManifest().getMainAttributes().getValue("Main-Class");
+        }
+        Method entry = Class.forName(mainClass).getMethod("main", String[].class);
+
+        // acts prints its progress to stdout, which is reserved for the protocol
+        System.setOut(new PrintStream(OutputStream.nullOutputStream()));
+
+        Path workspace = Files.createTempDirectory("acts-worker");
+        Path inputFile = workspace.resolve("input.txt");
+        Path outputFile = workspace.resolve("output.txt");
+
+        String line;
+        while ((line = readLine(in)) != null) {
+            if (line.equals("PING")) {
+                send(out, "PONG");
+                continue;
+            }
+            if (line.equals("EXIT")) {
+                break;
+            }
+            String[] header = line.split(" ");
+            if (header.length != 3 || !header[0].equals("REQ")) {
+                send(out, "ERR unknown request: " + line);
+                continue;
+            }
+            int length = Integer.parseInt(header[2]);
+            byte[] model = in.readNBytes(length);
+            if (model.length < length) {
+                return;
+            }
+            try {
+                Files.deleteIfExists(outputFile);
+                Files.write(inputFile, model);
+                System.setProperty("algo", "ipog");
+                System.setProperty("doi", header[1]);
+                System.setProperty("output", "csv");
+                try {
+                    entry.invoke(null, (Object) new String[]{inputFile.toString(), outputFile.toString()});
+                } catch (InvocationTargetException e) {
+                    if (!(e.getCause() instanceof ExitTrappedException)) {
+                        throw e;
+                    }
+                }
+                byte[] csv = Files.readAllBytes(outputFile);
+                out.write(("OK " + csv.length + "\n").getBytes(StandardCharsets.UTF_8));
+                out.write(csv);
+                out.flush();
+            } catch (Exception e) {
+                send(out, "ERR " + String.valueOf(e).replace('\n', ' '));
+            }
+        }
+    }
+
+    /** a line of the request without the line break, null at the end of the stream */
+    private static String readLine(InputStream in) throws IOException {
+        ByteArrayOutputStream line = new ByteArrayOutputStream();
+        int b;
+        while ((b = in.read()) != '\n') {
+            if (b < 0) {
+                return line.size() == 0 ? null : line.toString(StandardCharsets.UTF_8);
+            }
+            if (b != '\r') {
+                line.write(b);
+            }
+        }
+        return line.toString(StandardCharsets.UTF_8);
+    }
+
+    private static void send(OutputStream out, String line) throws IOException {
+        out.write((line + "\n").getBytes(StandardCharsets.UTF_8));
+        out.flush();
+    }
+
+    /** install the SecurityManager trapping System.exit, the error if it is not allowed */
+    @SuppressWarnings("removal")
+    private static String trapExit() {
+        try {
+            System.setSecurityManager(new SecurityManager() {
+                @Override
+                public void checkPermission(Permission perm) {
+                }
+
+                @Override
+                public void checkExit(int status) {
+                    throw new ExitTrappedException();
+                }
+            });
+            return null;
+        } catch (UnsupportedOperationException | SecurityException e) {
+            return String.valueOf(e).replace('\n', ' ');
+        }
+    }
+}
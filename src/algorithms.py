@@ -1,12 +1,19 @@
+import pickle
 import sys
+import threading
 import time
+from collections import Counter
+from itertools import count
 from loguru import logger
 from pathlib import Path
 
+# numpy (src.covering, src.sequence) and requests (src.executor) are imported eagerly on purpose, every run needs
+# them before its first request, and src/app.py only imports this module after the arguments are checked
 from src.ca import CA
-from src.info import RuntimeInfoManager
-from src.sequence import SCA
-from src.swagger import SwaggerParser
+from src.checkpoint import Checkpoint
+from src.info import RuntimeInfoManager, WorkerInfoManager
+from src.nlp import ConstraintStore
+from src.sequence import SCA, SequencePipeline
 
 
 class Initialize:
@@ -16,10 +23,17 @@ class Initialize:
 
         self._update_log_config()
 
-        swagger_parser = SwaggerParser(self._config)
-        self._operations = swagger_parser.extract()
+        # prance and openapi_parser are only imported when the specification is parsed
+        from src.swagger import load_operations
 
-        self._manager = RuntimeInfoManager(config)
+        self._operations = load_operations(self._config)
+
+        if self._config.store == "sqlite":
+            from src.database import SqliteInfoManager
+
+            self._manager = SqliteInfoManager(config, self._operations)
+        else:
+            self._manager = RuntimeInfoManager(config)
 
     def _update_log_config(self):
         loggerPath = Path(self._config.data_path) / "log/log_{time}.log"
@@ -34,21 +48,140 @@ class RestCT(Initialize):
     def __init__(self, config):
         super().__init__(config)
 
-        self._sca = SCA(self._config.s_strength, self._operations)
+        # a resumed run takes SCA from the checkpoint instead of building it again
+        self._sca = None if self._config.resume else SCA(self._config.s_strength, self._operations)
 
         self._ca = CA(self._config, manager=self._manager, operations=self._operations)
+        self._load_constraints()
+        # guards the runtime manager shared by the workers, and the checkpoints
+        self._lock = threading.RLock()
+
+        # keep one jvm for all covering arrays instead of starting acts for each of them
+        if self._config.engine == "acts":
+            self._ca.acts.start_worker(self._config.acts_timeout)
+
+    def _load_constraints(self):
+        """use the constraints extracted by src/precompile.py instead of nlp, if the store is current"""
+        store = ConstraintStore.load(self._config.constraints)
+        if store is None:
+            return
+        if not store.isCurrent(self._config.swagger, self._config.patterns):
+            self._logger.warning(f"constraint store {self._config.constraints} is outdated, run src/precompile.py again")
+            return
+        self._ca.load_constraints(store.constraints)
+        self._logger.info(f"constraints loaded from {self._config.constraints}")
+
+    def _save_checkpoint(self, pipeline: SequencePipeline, stop_time=None):
+        """the sequences being tested are tested again when the run is resumed"""
+        elapsed = (stop_time or time.time()) - self._ca.start_time
+        with self._lock, pipeline.paused() as sequences:
+            checkpoint = Checkpoint(Checkpoint.key_of(self._config), elapsed, sequences, self._sca,
+                                    self._manager.get_state(), self._ca.get_state(), pipeline.done)
+            try:
+                checkpoint.save(Checkpoint.path_of(self._config))
+            except (OSError, pickle.PicklingError, TypeError, AttributeError) as e:
+                self._logger.warning(f"cannot save checkpoint: {e}")
+            self._last_checkpoint = time.time()
+
+    def _resume(self):
+        """restore the state saved in the checkpoint, and return the built sequences which are not tested yet"""
+        path = Checkpoint.path_of(self._config)
+        checkpoint = Checkpoint.load(path, Checkpoint.key_of(self._config), self._operations)
+        if checkpoint is None:
+            raise Exception(f"cannot resume from checkpoint {path}")
+        if getattr(checkpoint, "complete", False):
+            raise Exception(f"the run of checkpoint {path} has tested all sequences, there is nothing to resume")
+        if checkpoint.elapsed >= self._config.budget:
+            raise Exception(f"the run of checkpoint {path} has used up the budget of {self._config.budget}s, "
+                            f"resume it with a larger --budget")
+        self._sca = checkpoint.sca
+        self._manager.set_state(checkpoint.manager)
+        self._ca.set_state(checkpoint.ca)
+        # the remaining budget is used
+        self._ca.start_time = time.time() - checkpoint.elapsed
+        self._logger.info(f"resume from checkpoint: {len(checkpoint.sequences)} sequences left, "
+                          f"elapsed: {checkpoint.elapsed:.1f}s")
+        return checkpoint.sequences
 
     def run(self):
         self._logger.info("operations: {}".format(len(self._operations)))
         self._ca.start_time = time.time()
+        self._last_checkpoint = time.time()
+
+        sequences = self._resume() if self._config.resume else []
+        # round 1: cover all operations, sequences are tested while the following ones are built
+        window = self._config.sequence_window
+        pipeline = SequencePipeline(self._sca, window, max(2 * window, window + self._config.workers),
+                                    sequences).start()
+
+        workers = self._workers()
+        counter = count(1)
+        errors = list()
+        try:
+            if len(workers) == 1:
+                self._work(workers[0], pipeline, counter)
+            else:
+                self._logger.info(f"workers: {len(workers)}")
+                threads = [threading.Thread(target=self._work, args=(worker, pipeline, counter, errors),
+                                            name=f"worker-{i}", daemon=True) for i, worker in enumerate(workers)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self._logger.info(f"at most {pipeline.peak} of {len(workers)} workers tested sequences at the same time")
+                if pipeline.peak == 1:
+                    self._logger.warning("the sequences write resources used by each other, they are tested one by "
+                                         "one and --workers does not help with this spec")
+                if len(errors) > 0:
+                    raise errors[0]
+        finally:
+            # the time waiting for the sequence being built is not counted in the budget
+            stop_time = time.time()
+            pipeline.close()
+            if self._config.checkpoint_interval > 0:
+                self._save_checkpoint(pipeline, stop_time)
+            statistics = Counter()
+            for worker in workers:
+                if worker is not self._ca:
+                    worker.close()
+                    statistics.update(worker.pool_statistics())
+            # the executor saves its pool statistics when it is closed, the ones of the workers are summed up
+            self._ca.close()
+            if len(workers) > 1:
+                self._manager.save_pool_statistics(dict(statistics))
+            self._manager.close()
+            self._logger.info("http connection pool: {}".format(self._manager.get_pool_statistics()))
 
-        # round 1: cover all operations
-        sequences = []
-        while not self._sca.is_all_covered():
-            sequences.append(self._sca.build_one_sequence())
+    def _workers(self):
+        """
+        the CA of each worker, a single worker tests the sequences with the CA of the run,
+        and each of several workers has its own executor and response chains
+        """
+        if self._config.workers == 1:
+            return [self._ca]
+        return [self._ca.fork(WorkerInfoManager(self._manager, self._lock)) for _ in range(self._config.workers)]
 
-        for index, sequence in enumerate(sorted(sequences, key=lambda s: len(s))):
-            logger.debug(f"{index+1}-th sequence : {sequence}")
-            flag = self._ca.handle(sequence)
-            if not flag:
-                break
\ No newline at end of file
+    def _work(self, ca: CA, pipeline: SequencePipeline, counter, errors=None):
+        """test the sequences dispatched by the pipeline until all are tested or the budget is used up"""
+        try:
+            while True:
+                sequence = pipeline.acquire()
+                if sequence is None:
+                    return
+                logger.debug(f"{next(counter)}-th sequence : {sequence}")
+                if not ca.handle(sequence):
+                    pipeline.stop()
+                    return
+                pipeline.release(sequence)
+                interval = self._config.checkpoint_interval
+                if interval > 0 and time.time() - self._last_checkpoint >= interval:
+                    with self._lock:
+                        # another worker may have saved it meanwhile
+                        if time.time() - self._last_checkpoint >= interval:
+                            self._save_checkpoint(pipeline)
+        except BaseException as e:
+            # the other workers stop after their current sequences
+            pipeline.stop()
+            if errors is None:
+                raise
+            errors.append(e)
@@ -1,19 +1,50 @@
-if __name__ == "__main__":
-    import sys
-    from src.config import *
-    from src.algorithms import RestCT
+import os
+import re
+import subprocess
+import sys
+
+
+def profile_imports(argv, top=15):
+    """run restct again with python -X importtime, and summarize the modules which take most time to import"""
+    argv = [a for a in argv if a != "--profile_imports"]
+    process = subprocess.Popen([sys.executable, "-X", "importtime"] + argv, stderr=subprocess.PIPE, text=True)
+    records = list()
+    for line in process.stderr:
+        matched = re.match(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)", line)
+        if matched is None:
+            sys.stderr.write(line)
+            continue
+        self_us, cumulative_us, indent, module = matched.groups()
+        records.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    process.wait()
+
+    print(f"import time: {sum(r[1] for r in records) / 1e6:.3f}s, {len(records)} modules", file=sys.stderr)
+    print(f"{'cumulative(ms)':>15} {'self(ms)':>10}  module (top-level imports)", file=sys.stderr)
+    for module, self_us, cumulative_us, _ in sorted([r for r in records if r[3] == 0],
+                                                    key=lambda r: r[2], reverse=True)[:top]:
+        print(f"{cumulative_us / 1e3:>15.1f} {self_us / 1e3:>10.1f}  {module}", file=sys.stderr)
+    return process.returncode
+
 
+if __name__ == "__main__":
     cur_path = os.path.abspath(os.path.dirname(__file__))
     root_path = os.path.split(cur_path)[0]
     sys.path.append(root_path)
 
-    # parse the arguments
+    from src.config import Config, parse_args
+
+    # parse the arguments before importing the algorithms, so that --help does not pay for heavy imports
     args = parse_args(root_path)
 
+    if args.profile_imports:
+        sys.exit(profile_imports(sys.argv))
+
     # check the configuration
     config = Config()
     config.check(args)
 
     # run the algorithm
+    from src.algorithms import RestCT
+
     restCT = RestCT(config)
     restCT.run()
@@ -1,16 +1,17 @@
 from collections import defaultdict
 
+import threading
 import time
 from loguru import logger
-from typing import List, Tuple
+from typing import List, Tuple, Dict
 
 from src.config import Config
+from src.covering import CoveringArray
 from src.executor import RestRequest
 from src.factor import Value, ValueType, StringFactor, EnumFactor, BooleanFactor, AbstractFactor
-from src.generator import ACTS
 from src.keywords import DataType
 from src.keywords import Method
-from src.nlp import Processor, Constraint
+from src.nlp import Processor, Constraint, markConstraintParams
 from src.rest import RestOp, RestParam, PathParam, QueryParam, BodyParam, HeaderParam
 
 
@@ -27,16 +28,56 @@ class CA:
         self._e_strength = config.e_strength  # cover strength for essential parameters
 
         self._manager = kwargs.get("manager")
-        self._executor = RestRequest(config.query, config.header, self._manager)
+        self._executor = RestRequest(config.query, config.header, self._manager,
+                                     config.pool_connections, config.pool_maxsize, config.keep_alive,
+                                     config.max_in_flight)
+        # cases of operations with these methods are sent concurrently
+        self._async_methods = set(config.async_methods)
 
         self._data_path = config.data_path
         self.start_time = None
 
-        self._acts = ACTS(self._data_path, config.jar)
+        # the covering array generator is created on first use
+        self._acts = None
+        # descriptions do not change during a run, constraints are parsed once per operation
+        self._constraints: Dict[str, List[Constraint]] = dict()
+        self._constraints_lock = threading.Lock()
+        # the CA this worker is forked from, which owns the covering array generator
+        self._parent = None
 
         # self._stat = kwargs.get("stat")
         self._operations = kwargs.get("operations")
 
+    @property
+    def acts(self):
+        if self._acts is None:
+            from src.generator import ACTS
+
+            self._acts = ACTS(self._config)
+        return self._acts
+
+    def fork(self, manager):
+        """
+        CA of another worker with its own executor and runtime manager, the covering array generator,
+        constraints and created resources are shared with this one
+        """
+        worker = CA(self._config, manager=manager, operations=self._operations)
+        worker._id_counter = self._id_counter
+        worker._acts = self.acts
+        worker._constraints = self._constraints
+        worker._constraints_lock = self._constraints_lock
+        worker._parent = self
+        worker.start_time = self.start_time
+        return worker
+
+    def pool_statistics(self) -> dict:
+        return self._executor.pool_statistics()
+
+    def close(self):
+        if self._acts is not None and self._parent is None:
+            self._acts.close()
+        self._executor.close()
+
     def _select_response_chains(self, response_chains):
         sorted_list = sorted(response_chains, key=lambda c: len(c.keys()), reverse=True)
         return sorted_list[:self._maxChainItems] if self._maxChainItems < len(sorted_list) else sorted_list
@@ -48,6 +89,8 @@ class CA:
         for index, operation in enumerate(sequence):
             logger.debug(f"{index + 1}-th operation: {operation}")
             chain_list = self._manager.get_chains(self._maxChainItems)
+            if index + 1 < len(sequence) and len(chain_list) > 0:
+                self._prefetch(sequence[index + 1], chain_list[0])
             loop_num = 0
             while len(chain_list):
                 loop_num += 1
@@ -58,14 +101,14 @@ class CA:
                 if is_break:
                     break
 
-        self._manager.save_response_to_file()
+        self._manager.flush()
         return True
 
     def _handle_one_operation(self, index, operation: RestOp, chain: dict, sequence, loop_num) -> bool:
         success_url_tuple = tuple([op for op in sequence[:index] if op in chain.keys()] + [operation])
         if len(operation.parameters) == 0:
             logger.debug("operation has no parameter, execute and return")
-            self._execute(operation, [{}], chain, success_url_tuple, [])
+            self._execute(operation, CoveringArray.empty(), chain, success_url_tuple, [])
             return True
 
         history = []
@@ -83,7 +126,7 @@ class CA:
                                                                                   index,
                                                                                   False)
         is_break_a = have_success_a or have_bug_a
-        self._manager.save_response(operation, e_response_list + a_response_list, e_ca + a_ca)
+        self._manager.save_response(operation, e_response_list + a_response_list, [e_ca, a_ca])
 
         return is_break_e or is_break_a
 
@@ -93,6 +136,11 @@ class CA:
             p.factor.set_value(case, is_reuse)
 
     def process(self, op: RestOp, case, chain, is_reuse=False):
+        method, url, header_param, kwargs = self._prepare_request(op, case, chain, is_reuse)
+        status_code, response_data = self._executor.send(method, url, header_param, **kwargs)
+        return status_code, response_data
+
+    def _prepare_request(self, op: RestOp, case, chain, is_reuse=False):
         self.set_param_value(op, case, is_reuse)
         url = op.resolved_url(chain)
         method = op.verb
@@ -102,20 +150,39 @@ class CA:
                         if isinstance(p, HeaderParam) and p.factor.value is not None}
         body_param = next(filter(lambda p: isinstance(p, BodyParam), op.parameters), None)
         body = body_param.factor.printable_value() if body_param is not None else None
-        kwargs = dict()
+        kwargs = dict(query=query_param, body=body)
         if body is not None:
             kwargs["Content-Type"] = body_param.content_type
-        status_code, response_data = self._executor.send(
-            method,
-            url,
-            header_param,
-            query=query_param,
-            body=body,
-            **kwargs
-        )
-        return status_code, response_data
+        return method, url, header_param, kwargs
 
-    def _execute(self, op: RestOp, ca, chain, url_tuple, history, is_reuse=False, is_essential=True):
+    @staticmethod
+    def _value_case(op: RestOp, case):
+        value_case = dict()
+        for factor in op.get_leaf_factors():
+            name = factor.get_global_name
+            if name in case:
+                value_case[name] = factor.printable_value()
+        return value_case
+
+    def _send_cases(self, op: RestOp, ca, chain, is_reuse):
+        """yield (status code, response, value case) of each case in the order of ca"""
+        if op.verb not in self._async_methods or len(ca) < 2:
+            for case in ca:
+                status_code, response_data = self.process(op, case, chain, is_reuse)
+                yield status_code, response_data, self._value_case(op, case)
+            return
+
+        # factors hold the values of one case at a time, so requests are prepared one by one and sent concurrently
+        request_list = list()
+        value_cases = list()
+        for case in ca:
+            request_list.append(self._prepare_request(op, case, chain, is_reuse))
+            value_cases.append(self._value_case(op, case))
+        responses = self._executor.send_all(request_list)
+        for (status_code, response_data), value_case in zip(responses, value_cases):
+            yield status_code, response_data, value_case
+
+    def _execute(self, op: RestOp, ca: CoveringArray, chain, url_tuple, history, is_reuse=False, is_essential=True):
         # self._stat.op_executed_num.add(op)
         history.clear()
 
@@ -127,9 +194,8 @@ class CA:
 
         response_list: List[(int, object)] = []
 
-        for case in ca:
+        for case, (status_code, response_data, value_case) in zip(ca, self._send_cases(op, ca, chain, is_reuse)):
             # self._stat.dump_snapshot()
-            status_code, response_data = self.process(op, case, chain, is_reuse)
             if status_code < 300:
                 has_success = True
                 history.append(case)
@@ -138,27 +204,61 @@ class CA:
             response_list.append((status_code, response_data))
 
             # save case
-            value_case = dict()
-            for factor in op.get_leaf_factors():
-                if factor.get_global_name in case:
-                    value_case[factor.get_global_name] = factor.printable_value()
             self._manager.save_case_response(op, value_case, response_data, status_code)
 
         logger.debug(f"Status codes: {[sc for (sc, res) in response_list]}")
         self._handle_response(url_tuple, op, response_list, chain, ca, is_essential)
         return has_success, has_bug, response_list
 
-    @staticmethod
-    def _reset_constraints(op: RestOp, parameters: List[RestParam]):
-        param_list = op.get_leaf_factors()
-        constraint_processor = Processor(param_list)
-        constraints: List[Constraint] = constraint_processor.parse()
+    def load_constraints(self, constraints: Dict[str, List[Constraint]]):
+        """constraints extracted ahead of time, keyed by operation id"""
+        for op in self._operations:
+            if op.id in constraints:
+                self._constraints[op.id] = constraints[op.id]
+                markConstraintParams(op.get_leaf_factors(), constraints[op.id])
+
+    def get_state(self) -> dict:
+        """state saved in checkpoints: created resources, constraints and generated covering arrays"""
+        with self._constraints_lock:
+            constraints = dict(self._constraints)
+        return {"id_counter": list(self._id_counter),
+                "constraints": {op_id: [c.toDict() for c in cs] for op_id, cs in constraints.items()},
+                "covering_arrays": self.acts.cache.get_state()}
+
+    def set_state(self, state: dict):
+        self._id_counter = list(state["id_counter"])
+        self.load_constraints({op_id: [Constraint.fromDict(c) for c in cs]
+                               for op_id, cs in state["constraints"].items()})
+        self.acts.cache.set_state(state["covering_arrays"])
+
+    def _reset_constraints(self, op: RestOp, parameters: List[RestParam]):
+        with self._constraints_lock:
+            constraints = self._constraints.get(op.id)
+            if constraints is None:
+                param_list = op.get_leaf_factors()
+                constraint_processor = Processor(param_list, self._config.nlp_batch_size, self._config.nlp_process)
+                constraints: List[Constraint] = constraint_processor.parse()
+                self._constraints[op.id] = constraints
         op.set_constraints(constraints)
 
-    def _handle_params(self, operation: RestOp, executed: List[RestOp], success_url_tuple, chain, history, index,
-                       is_essential, verify=False):
+    def _prefetch(self, operation: RestOp, chain):
+        """
+        let the acts pool generate the essential covering array of the next operation while the current one is
+        executed, the covering array of all parameters is not prefetched, because it depends on the successful
+        essential cases (history cases)
+        """
+        if not self.acts.can_prefetch or len(operation.parameters) == 0:
+            return
+        parameter_list = self._select_params(operation, True)
+        if len(parameter_list) == 0:
+            return
+        self._reset_constraints(operation, operation.parameters)
+        domain_map = self._build_domain_map(operation, parameter_list, chain, True)
+        self.acts.prefetch(operation, domain_map, operation.constraints, self._e_strength)
+
+    @staticmethod
+    def _select_params(operation: RestOp, is_essential) -> List[RestParam]:
         if is_essential:
-            logger.debug("handle essential parameters")
             parameter_list = list(filter(lambda p: p.factor.is_essential, operation.parameters))
             for p in operation.parameters:
                 add = False
@@ -170,11 +270,19 @@ class CA:
                 if add:
                     parameter_list.append(p)
         else:
-            logger.debug("handle all parameters")
             parameter_list = operation.parameters
+        return parameter_list
+
+    def _handle_params(self, operation: RestOp, executed: List[RestOp], success_url_tuple, chain, history, index,
+                       is_essential, verify=False):
+        if is_essential:
+            logger.debug("handle essential parameters")
+        else:
+            logger.debug("handle all parameters")
+        parameter_list = self._select_params(operation, is_essential)
         if len(parameter_list) == 0:
-            cover_array = [{}]
-            return self._execute(operation, cover_array, chain, success_url_tuple, history, False, True), [{}]
+            cover_array = CoveringArray.empty()
+            return self._execute(operation, cover_array, chain, success_url_tuple, history, False, True), cover_array
         else:
             is_reuse = False
             if is_essential:
@@ -212,14 +320,7 @@ class CA:
                 return self._execute(operation, cover_array, chain, success_url_tuple, history, is_reuse,
                                      False), cover_array
 
-    def _cover_params(self, operation: RestOp,
-                      parameters: List[RestParam],
-                      chain,
-                      strength,
-                      history_ca_of_current_op: List[dict],
-                      is_essential):
-        if history_ca_of_current_op is None:
-            history_ca_of_current_op = []
+    def _build_domain_map(self, operation: RestOp, parameters: List[RestParam], chain, is_essential):
         domain_map = defaultdict(list)
         for root_p in parameters:
             if isinstance(root_p, PathParam):
@@ -237,12 +338,25 @@ class CA:
                     root_p.factor.gen_domain()
                     if not self._manager.is_unresolved((operation, root_p.factor.get_global_name)):
                         domain_map = root_p.factor.add_domain_to_map(domain_map)
+        return domain_map
+
+    def _cover_params(self, operation: RestOp,
+                      parameters: List[RestParam],
+                      chain,
+                      strength,
+                      history_ca_of_current_op: List[dict],
+                      is_essential):
+        if history_ca_of_current_op is None:
+            history_ca_of_current_op = []
+        domain_map = self._build_domain_map(operation, parameters, chain, is_essential)
 
         if history_ca_of_current_op is not None and len(history_ca_of_current_op) > 0:
             new_domain_map = {
                 "history_ca_of_current_op": [Value(v, ValueType.Reused, DataType.Int32) for v in
                                              range(len(history_ca_of_current_op))]}
 
+            # the cases of covering arrays are read-only, the mutated history cases are new dicts
+            history_ca_of_current_op = [dict(case) for case in history_ca_of_current_op]
             for p in domain_map.keys():
                 if p not in history_ca_of_current_op[0].keys():
                     new_domain_map[p] = domain_map.get(p)
@@ -253,7 +367,7 @@ class CA:
             for c in operation.constraints:
                 for p in c.paramNames:
                     if self._manager.is_unresolved(p):
-                        return [{}]
+                        return CoveringArray.empty()
 
             domain_map = new_domain_map
 
@@ -265,7 +379,7 @@ class CA:
 
     def _call_acts(self, operation, domain_map, constraints, strength, history_ca_of_current_op):
         try:
-            return self._acts.process(operation, domain_map, constraints, strength, history_ca_of_current_op)
+            return self.acts.process(operation, domain_map, constraints, strength, history_ca_of_current_op)
         except Exception:
             logger.warning("call acts wrong")
 
@@ -275,14 +389,14 @@ class CA:
         except Exception:
             logger.warning("call pict wrong")
 
-    def _handle_response(self, url_tuple, operation, response_list, chain, ca, is_essential):
+    def _handle_response(self, url_tuple, operation, response_list, chain, ca: CoveringArray, is_essential):
         is_success = False
+        success_rows = list()
         for index, (sc, response) in enumerate(response_list):
             # self._stat.req_num += 1
             # self._stat.req_num_all += 1
             if sc < 300:
-                self._manager.save_reuse(url_tuple, is_essential, ca[index])
-                self._manager.save_ok_value(ca[index])
+                success_rows.append(index)
                 self._manager.save_chain(chain, operation, response)
                 self._manager.save_success_response(operation, response)
                 is_success = True
@@ -302,6 +416,10 @@ class CA:
                 # self._stat.bug.add(f"{operation.__repr__()}-{sc}-{response}")
             # elif sc >= 600:
             #     self._stat.req_60x_num += 1
+        if len(success_rows) > 0:
+            success_cases = ca.select(success_rows)
+            self._manager.save_reuse(url_tuple, is_essential, success_cases)
+            self._manager.save_ok_value(success_cases)
         if is_success:
             self._manager.save_success_seq(url_tuple)
             # self._stat.update_success_c_way(url_tuple)
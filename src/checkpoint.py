@@ -0,0 +1,96 @@
+import hashlib
+import io
+import os
+import pickle
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from src.rest import RestOp
+
+# version of the checkpoint format, checkpoints of other versions can not be resumed
+CHECKPOINT_VERSION = 1
+
+
+class OperationPickler(pickle.Pickler):
+    """operations are saved by their ids and restored as the operations of the run, instead of copies"""
+
+    def persistent_id(self, obj):
+        if isinstance(obj, RestOp):
+            return obj.__repr__()
+        return None
+
+
+class OperationUnpickler(pickle.Unpickler):
+    def __init__(self, file, operations: Dict[str, RestOp]):
+        super().__init__(file)
+        self._operations = operations
+
+    def persistent_load(self, pid):
+        if pid not in self._operations:
+            raise pickle.UnpicklingError(f"unknown operation: {pid}")
+        return self._operations[pid]
+
+
+def dumps(obj) -> bytes:
+    buffer = io.BytesIO()
+    OperationPickler(buffer, pickle.HIGHEST_PROTOCOL).dump(obj)
+    return buffer.getvalue()
+
+
+def loads(data: bytes, operations: Dict[str, RestOp]):
+    return OperationUnpickler(io.BytesIO(data), operations).load()
+
+
+class Checkpoint:
+    """
+    state of a run saved in <data_path>/checkpoint.pkl, from which a killed run is resumed:
+    the elapsed time, the sequences still to be tested, the sequence covering array,
+    the state of the runtime manager (chains, reused cases, ...) and the state of CA (constraints, covering arrays)
+    the checkpoint of a run which has tested all sequences is complete, and it can not be resumed
+    """
+
+    def __init__(self, key: str, elapsed: float, sequences: List[List[RestOp]], sca, manager: dict, ca: dict,
+                 complete: bool = False):
+        self.version = CHECKPOINT_VERSION
+        self.key = key
+        self.elapsed = elapsed
+        self.sequences = sequences
+        self.sca = sca
+        self.manager = manager
+        self.ca = ca
+        self.complete = complete
+
+    @staticmethod
+    def path_of(config) -> Path:
+        return Path(config.data_path) / "checkpoint.pkl"
+
+    @staticmethod
+    def key_of(config) -> str:
+        """a checkpoint is only resumed with the same spec and covering strengths"""
+        digest = hashlib.sha256(Path(config.swagger).read_bytes())
+        digest.update(f"{config.s_strength}/{config.e_strength}/{config.a_strength}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def save(self, path: Path):
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("wb") as fp:
+            fp.write(dumps(self))
+        os.replace(tmp, path)
+        logger.debug(f"checkpoint saved: {len(self.sequences)} sequences left, elapsed: {self.elapsed:.1f}s")
+
+    @staticmethod
+    def load(path: Path, key: str, operations: List[RestOp]) -> Optional["Checkpoint"]:
+        try:
+            checkpoint = loads(path.read_bytes(), {op.__repr__(): op for op in operations})
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            logger.warning(f"cannot load checkpoint {path}: {e}")
+            return None
+        if getattr(checkpoint, "version", None) != CHECKPOINT_VERSION:
+            logger.warning(f"checkpoint {path} is written by another version")
+            return None
+        if checkpoint.key != key:
+            logger.warning(f"checkpoint {path} is written for another spec or strengths")
+            return None
+        return checkpoint
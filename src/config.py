@@ -4,6 +4,8 @@ import os
 from argparse import Namespace
 from pathlib import Path
 
+from src.keywords import Method
+
 
 class Config:
     def __init__(self):
@@ -27,9 +29,28 @@ class Config:
 
         # constraint patterns for nlp recognition
         self.patterns = ""
+        # constraints extracted by src/precompile.py, used instead of nlp if it is current
+        self.constraints = ""
+        # texts in one nlp batch, and number of processes used by nlp
+        self.nlp_batch_size = 64
+        self.nlp_process = 1
 
         # acts jar file
         self.jar = ""
+        # covering array generator: acts (jar) or ipog (in process, its arrays are larger)
+        self.engine = "acts"
+        # timeout of one request to the acts worker (secs)
+        self.acts_timeout = 60
+        # max number of covering arrays kept in the cache, 0 disables the cache
+        self.cache_size = 1024
+        # keep the covering array cache in data_path for later runs
+        self.cache_persist = False
+        # workers generating covering arrays of upcoming operations in background, 0 disables it
+        self.ca_workers = 2
+        # thread or process pool of the workers
+        self.ca_pool = "thread"
+        # log the t-way combinations covered by each covering array, it is costly for large arrays
+        self.coverage_stats = False
         self.pict = ""
 
         # auth token
@@ -43,12 +64,33 @@ class Config:
 
         # data and log path
         self.data_path = ""
+        # compression of the json lines files of responses and cases: none, gzip or zstd
+        self.compress = "none"
+        # runtime data (cases, responses, reused cases) kept in memory or in a sqlite database
+        self.store = "memory"
+        # sequences are tested while they are built, the shortest one in a window of built sequences goes first
+        self.sequence_window = 16
+        # number of workers testing sequences in parallel, sequences of a worker do not share root paths with the others
+        self.workers = 1
+        # interval of the checkpoints in data_path (secs), 0 disables them
+        self.checkpoint_interval = 600
+        # resume the run from the checkpoint in data_path
+        self.resume = False
 
         # snapshot interval
         self.interval = .10
 
         self.server = None
 
+        # http connection pool: number of hosts, connections for each host, and keep-alive
+        self.pool_connections = 10
+        self.pool_maxsize = 10
+        self.keep_alive = True
+
+        # methods whose cases are sent concurrently, and the max number of requests in flight
+        self.async_methods = []
+        self.max_in_flight = 8
+
     def check(self, settings: Namespace):
         curFile = Path(__file__)
 
@@ -89,11 +131,35 @@ class Config:
         else:
             raise Exception("patterns are not provided")
 
+        if settings.constraints is not None and settings.constraints != "":
+            self.constraints = settings.constraints
+        else:
+            self.constraints = Path(self.swagger).with_suffix(".constraints.json").as_posix()
+
+        if settings.nlp_batch_size < 1:
+            raise Exception("nlp batch size must be positive")
+        self.nlp_batch_size = settings.nlp_batch_size
+        if settings.nlp_process == 0 or settings.nlp_process < -1:
+            raise Exception("number of nlp processes must be positive, or -1 for all cpus")
+        self.nlp_process = settings.nlp_process
+
+        self.engine = settings.engine
         self.jar = Path(settings.jar)
         if self.jar.exists() and self.jar.is_file():
             self.jar = self.jar.as_posix()
-        else:
+        elif self.engine == "acts":
             raise Exception("acts jar is not provided")
+        else:
+            # the jar is only used as a fallback of the ipog engine
+            self.jar = None
+        self.acts_timeout = settings.acts_timeout
+        self.cache_size = settings.cache_size
+        self.cache_persist = settings.cache_persist
+        if settings.ca_workers < 0:
+            raise Exception("number of covering array workers cannot be negative")
+        self.ca_workers = settings.ca_workers
+        self.ca_pool = settings.ca_pool
+        self.coverage_stats = settings.coverage_stats
 
         try:
             auth_token = json.loads(settings.header)
@@ -117,11 +183,48 @@ class Config:
         if settings.server is not None and settings.server != "":
             self.server = settings.server
 
+        if settings.pool_connections < 1 or settings.pool_maxsize < 1:
+            raise Exception("size of the http connection pool must be positive")
+        self.pool_connections = settings.pool_connections
+        self.pool_maxsize = settings.pool_maxsize
+        self.keep_alive = not settings.no_keep_alive
+
+        try:
+            self.async_methods = [Method.of(m.strip()) for m in settings.async_methods.split(",") if m.strip() != ""]
+        except ValueError as e:
+            raise Exception(f"invalid async methods: {e}")
+        if settings.max_in_flight < 1:
+            raise Exception("max number of requests in flight must be positive")
+        self.max_in_flight = settings.max_in_flight
+
+        if settings.compress == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise Exception("zstd compression requires the zstandard package")
+        self.compress = settings.compress
+        self.store = settings.store
+
         data_path = Path(f"{self.output_folder}/{self.exp_name}")
         self.data_path = data_path.as_posix()
         if not data_path.exists():
             data_path.mkdir()
 
+        if settings.sequence_window < 1:
+            raise Exception("sequence window must be positive")
+        self.sequence_window = settings.sequence_window
+
+        if settings.workers < 1:
+            raise Exception("number of workers must be positive")
+        self.workers = settings.workers
+
+        if settings.checkpoint_interval < 0:
+            raise Exception("checkpoint interval can not be negative")
+        self.checkpoint_interval = settings.checkpoint_interval
+        self.resume = settings.resume
+        if self.resume and not (data_path / "checkpoint.pkl").exists():
+            raise Exception(f"checkpoint does not exist in {self.data_path}")
+
         os.environ["patternFile"] = self.patterns
 
 
@@ -149,9 +252,40 @@ def parse_args(root_path) -> Namespace:
     parser.add_argument('--patterns',
                         help='constraint patterns for nlp processes',
                         type=str, required=False, default=f"{root_path}/lib/matchrules.json")
+    parser.add_argument('--constraints',
+                        help='constraint store written by src/precompile.py, default=<swagger file>.constraints.json',
+                        type=str, required=False, default="")
+    parser.add_argument('--nlp_batch_size',
+                        help='number of texts processed by spacy in one batch, default=64',
+                        type=int, required=False, default=64)
+    parser.add_argument('--nlp_process',
+                        help='number of processes used by spacy for large batches, -1 for all cpus, default=1',
+                        type=int, required=False, default=1)
     parser.add_argument('--jar',
                         help='acts jar file',
                         type=str, required=False, default=f"{root_path}/lib/acts_2.93.jar")
+    parser.add_argument('--engine',
+                        help='covering array generator, acts: call the acts jar, ipog: in process, its arrays are '
+                             'larger than the ones of acts, default=acts',
+                        type=str, required=False, default="acts", choices=["ipog", "acts"])
+    parser.add_argument('--acts_timeout',
+                        help='timeout of one request to the acts worker(Secs), default=60',
+                        type=int, required=False, default=60)
+    parser.add_argument('--cache_size',
+                        help='max number of cached covering arrays, 0 disables the cache, default=1024',
+                        type=int, required=False, default=1024)
+    parser.add_argument('--cache_persist',
+                        help='save the covering array cache for later runs',
+                        action='store_true', required=False, default=False)
+    parser.add_argument('--ca_workers',
+                        help='workers generating covering arrays in background, 0 disables it, default=2',
+                        type=int, required=False, default=2)
+    parser.add_argument('--ca_pool',
+                        help='pool of the covering array workers, process is only used by the ipog engine',
+                        type=str, required=False, default="thread", choices=["thread", "process"])
+    parser.add_argument('--coverage_stats',
+                        help='log the t-way combinations covered by each covering array, constraints are ignored',
+                        action='store_true', required=False, default=False)
     parser.add_argument('--header',
                         help='auth token: {keyName: token}',
                         type=str, required=False, default="{}")
@@ -167,6 +301,44 @@ def parse_args(root_path) -> Namespace:
     parser.add_argument('--server',
                         help='set if the forwarding proxy is running',
                         type=str, required=False, default="")
+    parser.add_argument('--pool_connections',
+                        help='number of hosts kept in the http connection pool, default=10',
+                        type=int, required=False, default=10)
+    parser.add_argument('--pool_maxsize',
+                        help='max number of connections kept for each host, default=10',
+                        type=int, required=False, default=10)
+    parser.add_argument('--no_keep_alive',
+                        help='close the http connection after each request',
+                        action='store_true', required=False, default=False)
+    parser.add_argument('--async_methods',
+                        help='http methods whose cases are sent concurrently, e.g. get,head',
+                        type=str, required=False, default="")
+    parser.add_argument('--max_in_flight',
+                        help='max number of concurrent requests for async methods, default=8',
+                        type=int, required=False, default=8)
+    parser.add_argument('--compress',
+                        help='compression of response.jsonl and case_response.jsonl, default=none',
+                        type=str, required=False, default="none", choices=["none", "gzip", "zstd"])
+    parser.add_argument('--store',
+                        help='keep runtime data in memory or in <data path>/runtime.db, default=memory',
+                        type=str, required=False, default="memory", choices=["memory", "sqlite"])
+    parser.add_argument('--sequence_window',
+                        help='number of built sequences from which the shortest one is tested first, default=16',
+                        type=int, required=False, default=16)
+    parser.add_argument('--workers',
+                        help='number of workers testing the sequences whose operations have different root paths '
+                             'in parallel, default=1',
+                        type=int, required=False, default=1)
+    parser.add_argument('--checkpoint_interval',
+                        help='interval of the checkpoints saved in the output folder(Secs), 0 disables them, '
+                             'default=600',
+                        type=int, required=False, default=600)
+    parser.add_argument('--resume',
+                        help='resume an interrupted run from its checkpoint with the remaining budget',
+                        action='store_true', required=False, default=False)
+    parser.add_argument('--profile_imports',
+                        help='run with python -X importtime and summarize the import time of modules',
+                        action='store_true', required=False, default=False)
 
     args = parser.parse_args()
     return args
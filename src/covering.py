@@ -0,0 +1,218 @@
+from collections.abc import Mapping, Sequence
+from itertools import combinations
+from typing import List, Tuple, Dict, Iterable
+
+import numpy as np
+
+from src.factor import Value, ValueType
+
+# index of the parameters which are absent in a row
+ABSENT = -1
+
+
+class Case(Mapping):
+    """
+    one row of a covering array, it maps the global names of the factors to their values
+    the values are decoded from the index matrix when they are read
+    """
+    __slots__ = ("_array", "_row")
+
+    def __init__(self, array, row: int):
+        self._array = array
+        self._row = row
+
+    def __getitem__(self, name: str) -> Value:
+        column = self._array.column_of(name)
+        if column is None:
+            raise KeyError(name)
+        value = self._array.value(self._row, column)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __iter__(self):
+        indexes = self._array.matrix[self._row]
+        return (name for name, index in zip(self._array.names, indexes) if index != ABSENT)
+
+    def __len__(self):
+        return int(np.count_nonzero(self._array.matrix[self._row] != ABSENT))
+
+    def __contains__(self, name):
+        column = self._array.column_of(name)
+        return column is not None and self._array.matrix[self._row, column] != ABSENT
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class CoveringArray(Sequence):
+    """
+    covering array stored as a numpy matrix of value indexes and the domain of each column,
+    the columns are named by the global names of the factors, and -1 marks the absent parameters of a row
+    the rows are only decoded into values when they are read by the factors
+    """
+    __slots__ = ("names", "_columns", "_domains", "matrix")
+
+    def __init__(self, names: Iterable[str], domains: Iterable[Iterable[Value]], matrix):
+        self.names: Tuple[str] = tuple(names)
+        self._columns: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
+        self._domains: Tuple[Tuple[Value]] = tuple(tuple(domain) for domain in domains)
+        largest = max((len(domain) for domain in self._domains), default=0)
+        dtype = next(t for t in (np.int8, np.int16, np.int32) if largest <= np.iinfo(t).max)
+        self.matrix: np.ndarray = np.asarray(matrix, dtype=dtype)
+        if self.matrix.ndim != 2:
+            self.matrix = self.matrix.reshape(len(self.matrix), len(self.names))
+
+    @staticmethod
+    def empty(rows: int = 1):
+        """covering array of the operations without parameters, each row is an empty case"""
+        return CoveringArray((), (), np.zeros((rows, 0), dtype=np.int8))
+
+    @staticmethod
+    def of(param_names, rows, domain_map, history_ca_of_current_op: List[Mapping]):
+        """
+        build the covering array from the value indexes generated by acts,
+        the column of history cases is expanded into one column for each parameter of the history cases
+        """
+        if "history_ca_of_current_op" not in param_names or len(history_ca_of_current_op) == 0:
+            return CoveringArray(param_names, [domain_map[p] for p in param_names], rows)
+
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1, len(param_names))
+        history_column = param_names.index("history_ca_of_current_op")
+        columns = [i for i, p in enumerate(param_names) if i != history_column]
+        names = [param_names[i] for i in columns]
+        domains = [domain_map[p] for p in names]
+
+        history_names = list()
+        for case in history_ca_of_current_op:
+            history_names.extend(p for p in case.keys() if p not in names and p not in history_names)
+        history_index = np.array([v.val for v in domain_map["history_ca_of_current_op"]])[rows[:, history_column]]
+        history_matrix = np.full((len(rows), len(history_names)), ABSENT, dtype=np.int64)
+        for j, p in enumerate(history_names):
+            domains.append([case.get(p) for case in history_ca_of_current_op])
+            present = np.array([p in case for case in history_ca_of_current_op], dtype=bool)
+            history_matrix[:, j] = np.where(present[history_index], history_index, ABSENT)
+        return CoveringArray(names + history_names, domains, np.hstack([rows[:, columns], history_matrix]))
+
+    @staticmethod
+    def concat(arrays: List["CoveringArray"]) -> "CoveringArray":
+        """
+        rows of the arrays one after another, the domains of the same column are joined,
+        and the same value objects share one index so that the equal rows can be removed by unique
+        """
+        if len(arrays) == 1:
+            return arrays[0]
+        names = list()
+        for array in arrays:
+            names.extend(n for n in array.names if n not in names)
+        domains = [list() for _ in names]
+        positions = [dict() for _ in names]
+        matrix = np.full((sum(len(a) for a in arrays), len(names)), ABSENT, dtype=np.int64)
+        start = 0
+        for array in arrays:
+            for column, name in enumerate(array.names):
+                target = names.index(name)
+                lookup = list()
+                for v in array.domain(column):
+                    if id(v) not in positions[target]:
+                        positions[target][id(v)] = len(domains[target])
+                        domains[target].append(v)
+                    lookup.append(positions[target][id(v)])
+                indexes = array.matrix[:, column].astype(np.int64)
+                matrix[start:start + len(array), target] = np.where(indexes != ABSENT,
+                                                                     np.array(lookup + [ABSENT])[indexes], ABSENT)
+            start += len(array)
+        return CoveringArray(names, domains, matrix).compact()
+
+    def column_of(self, name: str):
+        return self._columns.get(name)
+
+    def domain(self, column: int) -> Tuple[Value]:
+        return self._domains[column]
+
+    def value(self, row: int, column: int):
+        index = self.matrix[row, column]
+        return None if index == ABSENT else self._domains[column][index]
+
+    def used_values(self, column: int) -> List[Value]:
+        """values of the column in the order of their first appearance"""
+        indexes = self.matrix[:, column]
+        indexes = indexes[indexes != ABSENT]
+        unique, first = np.unique(indexes, return_index=True)
+        return [self._domains[column][i] for i in unique[np.argsort(first)]]
+
+    def select(self, rows) -> "CoveringArray":
+        """covering array of the given rows, e.g. the successful cases, the domains are shared"""
+        array = object.__new__(CoveringArray)
+        array.names = self.names
+        array._columns = self._columns
+        array._domains = self._domains
+        array.matrix = self.matrix[rows]
+        return array
+
+    def unique(self) -> "CoveringArray":
+        """remove the duplicate rows, the order of the rows is kept"""
+        if len(self) < 2:
+            return self
+        _, first = np.unique(self.matrix, axis=0, return_index=True)
+        if len(first) == len(self):
+            return self
+        return self.select(np.sort(first))
+
+    def compact(self) -> "CoveringArray":
+        """drop the values which are not used by any row from the domains"""
+        domains = list()
+        matrix = np.full(self.matrix.shape, ABSENT, dtype=np.int64)
+        for column in range(len(self.names)):
+            indexes = self.matrix[:, column]
+            present = indexes != ABSENT
+            used, inverse = np.unique(indexes[present], return_inverse=True)
+            matrix[present, column] = inverse
+            domains.append([self._domains[column][i] for i in used])
+        return CoveringArray(self.names, domains, matrix)
+
+    def with_generator(self, generator: ValueType) -> "CoveringArray":
+        """same rows with the values marked as generated by the generator, e.g. reused"""
+        domains = [[None if v is None else Value(v.val, generator, v.type) for v in domain] for domain in self._domains]
+        return CoveringArray(self.names, domains, self.matrix)
+
+    def count_covered(self, strength: int) -> int:
+        """number of t-way value combinations covered by the rows"""
+        strength = min(strength, len(self.names))
+        if strength == 0 or len(self) == 0:
+            return 0
+        matrix = self.matrix.astype(np.int64) + 1
+        sizes = [len(domain) + 1 for domain in self._domains]
+        covered = 0
+        for columns in combinations(range(len(self.names)), strength):
+            codes = np.zeros(len(self), dtype=np.int64)
+            for c in columns:
+                codes = codes * sizes[c] + matrix[:, c]
+            valid = np.all(matrix[:, columns] > 0, axis=1)
+            covered += len(np.unique(codes[valid]))
+        return covered
+
+    def count_combinations(self, strength: int) -> int:
+        """number of t-way value combinations of the domains, the ones excluded by constraints are counted too"""
+        strength = min(strength, len(self.names))
+        if strength == 0:
+            return 0
+        return sum(int(np.prod([len(self._domains[c]) for c in columns], dtype=np.int64))
+                   for columns in combinations(range(len(self.names)), strength))
+
+    def is_covering(self, strength: int) -> bool:
+        """whether all t-way value combinations are covered, constraints are not considered"""
+        return self.count_covered(strength) == self.count_combinations(strength)
+
+    def __getitem__(self, row: int) -> Case:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return Case(self, row)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def __repr__(self):
+        return f"CoveringArray(rows={len(self)}, columns={len(self.names)})"
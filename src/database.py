@@ -0,0 +1,186 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Tuple
+
+from src.checkpoint import dumps, loads
+from src.covering import CoveringArray
+from src.factor import Value, ValueType
+from src.info import RuntimeInfoManager
+from src.rest import RestOp
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS test_case (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    operation TEXT NOT NULL,
+    status_code INTEGER,
+    "case" TEXT,
+    response TEXT,
+    time REAL
+);
+CREATE INDEX IF NOT EXISTS test_case_operation ON test_case (operation);
+CREATE INDEX IF NOT EXISTS test_case_status_code ON test_case (status_code);
+
+CREATE TABLE IF NOT EXISTS error_response (
+    digest BLOB PRIMARY KEY,
+    operation TEXT NOT NULL,
+    response TEXT
+);
+CREATE INDEX IF NOT EXISTS error_response_operation ON error_response (operation);
+
+CREATE TABLE IF NOT EXISTS reused_case (
+    sequence TEXT NOT NULL,
+    essential INTEGER NOT NULL,
+    cases BLOB,
+    PRIMARY KEY (sequence, essential)
+);
+
+CREATE TABLE IF NOT EXISTS ok_value (
+    parameter TEXT NOT NULL,
+    value BLOB
+);
+CREATE INDEX IF NOT EXISTS ok_value_parameter ON ok_value (parameter);
+
+CREATE TABLE IF NOT EXISTS success_sequence (
+    sequence TEXT PRIMARY KEY,
+    length INTEGER
+);
+"""
+
+
+class SqliteInfoManager(RuntimeInfoManager):
+    """
+    runtime manager keeping test cases, error responses, reused cases, ok values and success sequences
+    in a sqlite database (<data_path>/runtime.db) instead of memory, so that they survive a crash and
+    can be queried after the run
+    the database of a previous run is removed when the run starts, it is only kept to resume that run
+    test cases are inserted in batches, and all writes are committed at least every commit_interval seconds
+    the ok values are few for each parameter, they are kept in memory as well, and loaded from the database once
+    """
+    _transient = RuntimeInfoManager._transient + ("_operations", "_batch_size", "_commit_interval", "_last_commit",
+                                                  "path", "_lock", "_connection", "_cases", "_ok_value_dict")
+
+    def __init__(self, config, operations: List[RestOp], batch_size: int = 256, commit_interval: float = 1.0):
+        super().__init__(config)
+        self._operations: Dict[str, RestOp] = {op.__repr__(): op for op in operations}
+        self._batch_size = batch_size
+        self._commit_interval = commit_interval
+        self._last_commit = time.time()
+        self.path = Path(config.data_path) / "runtime.db"
+        if not config.resume:
+            for path in (self.path, self.path.with_name("runtime.db-wal"), self.path.with_name("runtime.db-shm")):
+                path.unlink(missing_ok=True)
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(self.path.as_posix(), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        self._connection.commit()
+        self._cases: List[tuple] = list()
+
+    @staticmethod
+    def _sequence_key(operations: Tuple[RestOp]) -> str:
+        return json.dumps([op.__repr__() for op in operations])
+
+    @staticmethod
+    def _dumps(obj) -> bytes:
+        return dumps(obj)
+
+    def _loads(self, data: bytes):
+        return loads(data, self._operations)
+
+    def _get_reused(self, operations: Tuple[RestOp], is_essential) -> CoveringArray:
+        with self._lock:
+            row = self._connection.execute("SELECT cases FROM reused_case WHERE sequence = ? AND essential = ?",
+                                           (self._sequence_key(operations), int(is_essential))).fetchone()
+        if row is None:
+            return CoveringArray.empty(0)
+        return self._loads(row[0]).with_generator(ValueType.Reused)
+
+    def get_reused_with_essential_p(self, operations: Tuple[RestOp]) -> CoveringArray:
+        return self._get_reused(operations, True)
+
+    def get_reused_with_all_p(self, operations: Tuple[RestOp]) -> CoveringArray:
+        return self._get_reused(operations, False)
+
+    def save_reuse(self, url_tuple, is_essential, cases: CoveringArray):
+        key = self._sequence_key(url_tuple)
+        with self._lock:
+            row = self._connection.execute("SELECT cases FROM reused_case WHERE sequence = ? AND essential = ?",
+                                           (key, int(is_essential))).fetchone()
+            if row is not None:
+                reused_case = self._loads(row[0])
+                if len(reused_case) >= 10:
+                    return
+                cases = CoveringArray.concat([reused_case, cases])
+            cases = cases.unique().select(slice(0, 10)).compact()
+            self._connection.execute("INSERT OR REPLACE INTO reused_case (sequence, essential, cases) VALUES (?, ?, ?)",
+                                     (key, int(is_essential), self._dumps(cases)))
+            self._commit_if_due()
+
+    def _ok_values(self, paramStr) -> List[Value]:
+        lst = self._ok_value_dict.get(paramStr)
+        if lst is None:
+            lst = [self._loads(row[0]) for row in
+                   self._connection.execute("SELECT value FROM ok_value WHERE parameter = ?", (paramStr,))]
+            self._ok_value_dict[paramStr] = lst
+        return lst
+
+    def save_ok_value(self, cases: CoveringArray):
+        with self._lock:
+            for column, paramStr in enumerate(cases.names):
+                lst = self._ok_values(paramStr)
+                for value in cases.used_values(column):
+                    if len(lst) == 0 or (len(lst) < 10 and value not in lst):
+                        lst.append(value)
+                        self._connection.execute("INSERT INTO ok_value (parameter, value) VALUES (?, ?)",
+                                                 (paramStr, self._dumps(value)))
+            self._commit_if_due()
+
+    def save_success_seq(self, url_tuple):
+        with self._lock:
+            self._connection.execute("INSERT OR IGNORE INTO success_sequence (sequence, length) VALUES (?, ?)",
+                                     (self._sequence_key(url_tuple), len(url_tuple)))
+            self._commit_if_due()
+
+    def _save_error_response(self, op, response: str):
+        digest = hashlib.md5(f"{op.__repr__()}\n{response}".encode("utf-8")).digest()
+        with self._lock:
+            self._connection.execute("INSERT OR IGNORE INTO error_response (digest, operation, response) "
+                                     "VALUES (?, ?, ?)", (digest, op.__repr__(), response))
+            self._commit_if_due()
+
+    def save_case_response(self, op, case, response_data, status_code):
+        with self._lock:
+            self._cases.append((op.__repr__(), status_code, json.dumps(case, default=str),
+                                json.dumps(response_data, default=str), time.time()))
+            if len(self._cases) >= self._batch_size:
+                self._commit()
+            else:
+                self._commit_if_due()
+
+    def _commit_if_due(self):
+        if time.time() - self._last_commit >= self._commit_interval:
+            self._commit()
+
+    def _commit(self):
+        if len(self._cases) > 0:
+            self._connection.executemany('INSERT INTO test_case (operation, status_code, "case", response, time) '
+                                         'VALUES (?, ?, ?, ?, ?)', self._cases)
+            self._cases.clear()
+        self._connection.commit()
+        self._last_commit = time.time()
+
+    def flush(self):
+        super().flush()
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        super().close()
+        with self._lock:
+            self._commit()
+            self._connection.close()
@@ -1,7 +1,11 @@
-from typing import Tuple, Union, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+from typing import Tuple, Union, Optional, List
 
 import requests
 from loguru import logger
+from requests.adapters import HTTPAdapter
 
 from src.rest import ContentType
 from src.rest import Method
@@ -23,13 +27,65 @@ class Auth:
         return r
 
 
+class PoolAdapter(HTTPAdapter):
+    """http adapter counting the requests sent and the connections actually opened"""
+
+    def __init__(self, *args, **kwargs):
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+
+        def counting(pool_cls):
+            class ConnectionCls(pool_cls.ConnectionCls):
+                def connect(self):
+                    with adapter._lock:
+                        adapter.connections += 1
+                    super().connect()
+
+            return type(pool_cls.__name__, (pool_cls,), {"ConnectionCls": ConnectionCls})
+
+        self.poolmanager.pool_classes_by_scheme = {scheme: counting(pool_cls) for scheme, pool_cls in
+                                                   self.poolmanager.pool_classes_by_scheme.items()}
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            self.requests += 1
+        return super().send(request, **kwargs)
+
+
 class RestRequest:
     UNEXPECTED = 700
 
-    def __init__(self, query_auth, header_auth, manager):
+    def __init__(self, query_auth, header_auth, manager, pool_connections=10, pool_maxsize=10, keep_alive=True,
+                 max_in_flight=8):
         self.auth = None if len(query_auth) == 0 and len(header_auth) == 0 else Auth(query_auth, header_auth)
         self._manager = manager
 
+        # one session for all requests, so that tcp/tls connections are reused
+        # pool_connections: number of hosts kept in the pool, pool_maxsize: connections kept for each host
+        self._session = requests.Session()
+        self._adapter = PoolAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self._session.mount("http://", self._adapter)
+        self._session.mount("https://", self._adapter)
+        if not keep_alive:
+            self._session.headers["Connection"] = "close"
+        # requests are independent test cases, cookies set by the sut must not leak into the next ones
+        self._session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        # max number of concurrent requests in send_all
+        self._max_in_flight = max_in_flight
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def pool_statistics(self) -> dict:
+        requests_num, connections = self._adapter.requests, self._adapter.connections
+        return {"requests": requests_num, "new_connections": connections,
+                "reused": max(requests_num - connections, 0)}
+
     @staticmethod
     def validate(verb: Method, url: str, headers: dict, **kwargs):
         """
@@ -71,28 +127,44 @@ class RestRequest:
         logger.debug(f"{verb.value}:{url} {status_code}, {response_content}, Request Data: {kwargs}")
         return status_code, response_content
 
-    @staticmethod
-    def send_request_with_content(method: Method, url: str, headers: dict, auth: Optional[Auth], **kwargs) \
+    def send_all(self, request_list: List[Tuple[Method, str, dict, dict]]) -> List[Tuple[int, Union[str, dict]]]:
+        """send (verb, url, headers, kwargs) requests concurrently, responses are returned in the same order"""
+        if self._pool is None:
+            # the size of the pool bounds the number of requests in flight
+            self._pool = ThreadPoolExecutor(self._max_in_flight, thread_name_prefix="request")
+        return list(self._pool.map(self._send_one, request_list))
+
+    def _send_one(self, request: Tuple[Method, str, dict, dict]) -> Tuple[int, Union[str, dict]]:
+        verb, url, headers, kwargs = request
+        return self.send(verb, url, headers, **kwargs)
+
+    def send_request_with_content(self, method: Method, url: str, headers: dict, auth: Optional[Auth], **kwargs) \
             -> Tuple[int, Union[str, dict]]:
         content_type = kwargs.get("Content-Type", ContentType.JSON)
 
         if "json" in content_type.value.lower():
-            response = requests.request(method=method.value, url=url, headers=headers, params=kwargs.get("query", None),
-                                        json=kwargs.get("body", None), files=kwargs.get("files", None), timeout=10,
-                                        auth=auth)
+            response = self._session.request(method=method.value, url=url, headers=headers,
+                                             params=kwargs.get("query", None), json=kwargs.get("body", None),
+                                             files=kwargs.get("files", None), timeout=10, auth=auth)
         else:
-            response = requests.request(method=method.value, url=url, headers=headers, params=kwargs.get("query", None),
-                                        data=kwargs.get("body", None), files=kwargs.get("files", None), timeout=10,
-                                        auth=auth)
+            response = self._session.request(method=method.value, url=url, headers=headers,
+                                             params=kwargs.get("query", None), data=kwargs.get("body", None),
+                                             files=kwargs.get("files", None), timeout=10, auth=auth)
 
         return RestRequest.get_response_info(response)
 
-    @staticmethod
-    def send_request(verb: Method, url, headers, auth, **kwargs) -> Tuple[int, Union[str, dict]]:
-        feedback = requests.request(method=verb.value, url=url, headers=headers, params=kwargs.get("query", None),
-                                    timeout=10, auth=auth)
+    def send_request(self, verb: Method, url, headers, auth, **kwargs) -> Tuple[int, Union[str, dict]]:
+        feedback = self._session.request(method=verb.value, url=url, headers=headers, params=kwargs.get("query", None),
+                                         timeout=10, auth=auth)
         return RestRequest.get_response_info(feedback)
 
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self._manager.save_pool_statistics(self.pool_statistics())
+        self._session.close()
+
     @staticmethod
     def get_response_info(feedback: requests.Response) -> Tuple[int, Union[str, dict]]:
         status_code = feedback.status_code
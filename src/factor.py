@@ -5,12 +5,11 @@ import os
 import random
 import re
 import string
-from dataclasses import dataclass
+from dataclasses import FrozenInstanceError
 from enum import Enum
+from functools import lru_cache
 from typing import Optional, Any, List, Union, Tuple
 
-import Levenshtein
-
 from src.keywords import DataType
 
 
@@ -24,11 +23,107 @@ class ValueType(Enum):
     NULL = "Null"
 
 
-@dataclass(frozen=True)
 class Value:
-    val: object = None
-    generator: ValueType = ValueType.NULL
-    type: DataType = DataType.NULL
+    """
+    immutable value of a factor, there are many of them in domains and covering arrays,
+    so the fields are kept in slots instead of a __dict__
+    """
+    __slots__ = ("val", "generator", "type")
+
+    def __init__(self, val: object = None, generator: ValueType = ValueType.NULL, type: DataType = DataType.NULL):
+        object.__setattr__(self, "val", val)
+        object.__setattr__(self, "generator", generator)
+        object.__setattr__(self, "type", type)
+
+    def __setattr__(self, name, value):
+        raise FrozenInstanceError(f"cannot assign to field '{name}'")
+
+    def __delattr__(self, name):
+        raise FrozenInstanceError(f"cannot delete field '{name}'")
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.val == other.val and self.generator is other.generator and self.type is other.type
+
+    def __hash__(self):
+        return hash((self.val, self.generator, self.type))
+
+    def __repr__(self):
+        return f"Value(val={self.val!r}, generator={self.generator!r}, type={self.type!r})"
+
+    def __reduce__(self):
+        return self.__class__, (self.val, self.generator, self.type)
+
+
+@lru_cache(maxsize=None)
+def _slots_of(cls) -> Tuple[str]:
+    """names of all the slots of a factor class, including the ones of its bases"""
+    return tuple(attr for c in reversed(cls.__mro__) for attr in c.__dict__.get("__slots__", ()))
+
+
+class ResponseIndex:
+    """
+    keys of a response flattened in the order they are visited from the root,
+    lists are represented by their first item as in the dynamic values, and each key knows where its subtree ends
+    """
+    __slots__ = ("response", "_paths", "_values", "_ends", "_best")
+
+    def __init__(self, response):
+        self.response = response
+        self._paths: List[Tuple[str]] = list()
+        self._values: list = list()
+        self._ends: List[int] = list()
+        # best matched key of each parameter name
+        self._best: dict = dict()
+        self._flatten(response, ())
+
+    def _flatten(self, response, path):
+        if isinstance(response, list):
+            if response:
+                self._flatten(response[0], path)
+        elif isinstance(response, dict):
+            for k, v in response.items():
+                index = len(self._paths)
+                self._paths.append(path + (k,))
+                self._values.append(v)
+                self._ends.append(index + 1)
+                if isinstance(v, (list, dict)):
+                    self._flatten(v, path + (k,))
+                    self._ends[index] = len(self._paths)
+
+    def find(self, param_name):
+        """yield (path, similarity, value) of the keys similar to the name, the subtrees of matched keys are skipped"""
+        index = 0
+        while index < len(self._paths):
+            path = self._paths[index]
+            similarity = AbstractFactor.match(param_name, path[-1])
+            if similarity > 0.9:
+                yield path, similarity, self._values[index]
+                index = self._ends[index]
+            else:
+                index += 1
+
+    def best_match(self, param_name):
+        """(path, similarity, value) of the most similar key, the shortest path wins a tie"""
+        if param_name not in self._best:
+            similarity_max = 0
+            path_depth_minimum = 10
+            right_path = None
+            right_value = None
+            for path, similarity, value in self.find(param_name):
+                if similarity > similarity_max:
+                    right_path = path
+                    path_depth_minimum = len(path)
+                    similarity_max = similarity
+                    right_value = value
+                elif similarity == similarity_max:
+                    if len(path) < path_depth_minimum:
+                        right_path = path
+                        path_depth_minimum = len(path)
+                        right_value = value
+            self._best[param_name] = right_path, similarity_max, right_value
+        return self._best[param_name]
 
 
 class AbstractFactor(metaclass=abc.ABCMeta):
@@ -36,16 +131,22 @@ class AbstractFactor(metaclass=abc.ABCMeta):
     """
     Abstract class for Factors
     """
+    __slots__ = ("_name", "description", "required", "_parent", "_global_name", "_examples", "_shared_examples",
+                 "_default", "format", "is_constraint", "domain", "isReuse", "value")
 
     def __init__(self, name: str):
-        self.name: str = name
+        self._name: str = name
         self.description: Optional[str] = None
 
         # Set the required flag to true
         self.required: bool = False
-        self.parent: Optional[AbstractFactor] = None
+        self._parent: Optional[AbstractFactor] = None
+        # dotted name from the root, computed on first use and reset when the factor is renamed or moved
+        self._global_name: Optional[str] = None
 
         self._examples: list = []
+        # examples are shared by the clones of a factor, and copied before they are changed
+        self._shared_examples: bool = False
         self._default: Optional[Any] = None
         self.format = None
         self.is_constraint = False
@@ -81,21 +182,7 @@ class AbstractFactor(metaclass=abc.ABCMeta):
         high_weight, low_weight = AbstractFactor._analyse_url_relation(op, op_set, self.name)
         for predecessor in high_weight:
             response = chain.get(predecessor)
-            similarity_max = 0
-            path_depth_minimum = 10
-            right_path = None
-            right_value = None
-            for path, similarity, value in AbstractFactor.find_dynamic(self.name, response):
-                if similarity > similarity_max:
-                    right_path = path
-                    path_depth_minimum = len(path)
-                    similarity_max = similarity
-                    right_value = value
-                elif similarity == similarity_max:
-                    if len(path) < path_depth_minimum:
-                        right_path = path
-                        path_depth_minimum = len(path)
-                        right_value = value
+            right_path, similarity_max, right_value = manager.response_index(response).best_match(self.name)
             if similarity_max > 0 and right_value not in response_value:
                 dynamic_values.append((predecessor, right_path))
         if len(dynamic_values) > 0:
@@ -122,32 +209,14 @@ class AbstractFactor(metaclass=abc.ABCMeta):
         return high_weight, low_weight
 
     @staticmethod
-    def find_dynamic(paramName, response, path=None):
-        if re.search(r"[-_]?id[-_]?", paramName) is not None:
-            name = "id"
-        if path is None:
-            path = []
-        if isinstance(response, list):
-            local_path = path[:]
-            if response:
-                for result in AbstractFactor.find_dynamic(paramName, response[0], local_path):
-                    yield result
-        elif isinstance(response, dict):
-            for k, v in response.items():
-                local_path = path[:]
-                similarity = AbstractFactor.match(paramName, k)
-                if similarity > 0.9:
-                    local_path.append(k)
-                    yield local_path, similarity, v
-                elif isinstance(v, (list, dict)):
-                    local_path.append(k)
-                    for result in AbstractFactor.find_dynamic(paramName, v, local_path[:]):
-                        yield result
-        else:
-            pass
+    def find_dynamic(paramName, response):
+        return ResponseIndex(response).find(paramName)
 
     @staticmethod
+    @lru_cache(maxsize=65536)
     def match(str_a, str_b):
+        import Levenshtein
+
         str_a = "".join(c for c in str_a if c.isalnum())
         str_b = "".join(c for c in str_b if c.isalnum())
         distance = Levenshtein.distance(str_a.lower(), str_b.lower())
@@ -160,13 +229,10 @@ class AbstractFactor(metaclass=abc.ABCMeta):
         return domain_map
 
     def set_value(self, case, is_reuse=False):
-        self.value = None
-        for name, value in case.items():
-            if name == self.get_global_name:
-                if not is_reuse:
-                    self.value = value
-                else:
-                    self.value = self.mutate_value(value)
+        value = case.get(self.get_global_name)
+        if value is not None and is_reuse:
+            value = self.mutate_value(value)
+        self.value = value
 
     def printable_value(self, response=None):
         if self.value is not None and self.value.generator is ValueType.Dynamic:
@@ -228,12 +294,40 @@ class AbstractFactor(metaclass=abc.ABCMeta):
     def __repr__(self):
         return self.get_global_name
 
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @name.setter
+    def name(self, name: str):
+        self._name = name
+        self._reset_global_name()
+
+    @property
+    def parent(self):
+        return self._parent
+
+    @parent.setter
+    def parent(self, parent):
+        self._parent = parent
+        self._reset_global_name()
+
+    def _children(self) -> Tuple:
+        return ()
+
+    def _reset_global_name(self):
+        self._global_name = None
+        for child in self._children():
+            child._reset_global_name()
+
     @property
     def get_global_name(self):
-        if self.parent is not None:
-            return f"{self.parent.get_global_name}.{self.name}"
-        else:
-            return self.name
+        if self._global_name is None:
+            if self._parent is not None:
+                self._global_name = f"{self._parent.get_global_name}.{self._name}"
+            else:
+                self._global_name = self._name
+        return self._global_name
 
     def __hash__(self):
         return hash(self.get_global_name)
@@ -263,10 +357,31 @@ class AbstractFactor(metaclass=abc.ABCMeta):
     def set_example(self, example):
         parsed_example = self._spilt_example(example)
         if parsed_example is not None:
+            if self._shared_examples:
+                self._examples = list(self._examples)
+                self._shared_examples = False
             for e in parsed_example:
                 if e not in self._examples:
                     self._examples.append(e)
 
+    def clone(self, name: str = None):
+        """
+        copy of the factor with its own state (name, parent, domain and value), the data extracted from the
+        schema (enum values, examples) is shared with the original
+        """
+        factor = object.__new__(self.__class__)
+        for attr in _slots_of(self.__class__):
+            object.__setattr__(factor, attr, getattr(self, attr))
+        if name is not None:
+            factor._name = name
+        factor._parent = None
+        factor._global_name = None
+        factor.domain = list()
+        factor.value = None
+        self._shared_examples = True
+        factor._shared_examples = True
+        return factor
+
     @property
     def all_examples(self):
         return self._examples
@@ -287,6 +402,8 @@ class AbstractFactor(metaclass=abc.ABCMeta):
 
 
 class StringFactor(AbstractFactor):
+    __slots__ = ("type", "minLength", "maxLength")
+
     def __init__(self, name: str, format: str = None, min_length: int = 0, max_length: int = 100):
         super().__init__(name)
         self.type = DataType.String
@@ -339,6 +456,8 @@ class StringFactor(AbstractFactor):
 
 
 class IntegerFactor(AbstractFactor):
+    __slots__ = ("type", "minimum", "maximum")
+
     def __init__(self, name: str, minimum: int = None, maximum: int = None):
         super().__init__(name)
         self.type = DataType.Integer
@@ -380,6 +499,8 @@ class IntegerFactor(AbstractFactor):
 
 
 class NumberFactor(AbstractFactor):
+    __slots__ = ("type", "minimum", "maximum")
+
     def __init__(self, name: str, minimum: int = None, maximum: int = None):
         super().__init__(name)
         self.type = DataType.Number
@@ -421,6 +542,8 @@ class NumberFactor(AbstractFactor):
 
 
 class BooleanFactor(AbstractFactor):
+    __slots__ = ("type",)
+
     def __init__(self, name: str):
         super().__init__(name)
         self.type = DataType.Bool
@@ -434,6 +557,8 @@ class BooleanFactor(AbstractFactor):
 
 
 class ObjectFactor(AbstractFactor):
+    __slots__ = ("type", "properties")
+
     def __init__(self, name: str):
         super().__init__(name)
         self.type = DataType.Object
@@ -444,6 +569,16 @@ class ObjectFactor(AbstractFactor):
         self.properties.append(p)
         p.parent = self
 
+    def _children(self) -> Tuple:
+        return tuple(self.properties)
+
+    def clone(self, name: str = None):
+        factor = super().clone(name)
+        factor.properties = []
+        for p in self.properties:
+            factor.add_property(p.clone())
+        return factor
+
     def gen_domain(self):
         self.domain.clear()
         for p in self.properties:
@@ -477,6 +612,8 @@ class ObjectFactor(AbstractFactor):
 
 
 class ArrayFactor(AbstractFactor):
+    __slots__ = ("type", "item")
+
     def __init__(self, name: str):
         super().__init__(name)
         self.type = DataType.Array
@@ -486,6 +623,15 @@ class ArrayFactor(AbstractFactor):
         self.item = item
         self.item.parent = self
 
+    def _children(self) -> Tuple:
+        return (self.item,) if self.item is not None else ()
+
+    def clone(self, name: str = None):
+        factor = super().clone(name)
+        if self.item is not None:
+            factor.set_item(self.item.clone())
+        return factor
+
     def gen_domain(self):
         self.domain.clear()
         if self.item is not None:
@@ -513,6 +659,8 @@ class ArrayFactor(AbstractFactor):
 
 
 class EnumFactor(AbstractFactor):
+    __slots__ = ("enum_value",)
+
     def __init__(self, name: str, enum_value: list):
         super().__init__(name)
         self.enum_value = enum_value
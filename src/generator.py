@@ -1,23 +1,256 @@
+import hashlib
+import json
+import multiprocessing
 import os
+import queue
 import random
 import re
 import shlex
 import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 
-import chardet
+from loguru import logger
 
-from src.factor import Value
+from src.covering import CoveringArray
+from src.ipog import IPOG
 from src.nlp import Constraint
 
 
-class ACTS:
-    def __init__(self, data_path, jar):
-        self._workplace = Path(data_path) / "acts"
+WORKER_SOURCE = Path(__file__).resolve().parent.parent / "lib" / "ActsWorker.java"
+
+
+class ActsWorker:
+    """
+    a long-lived jvm running lib/ActsWorker.java, models are streamed through stdin and
+    covering arrays are read back from stdout, see the protocol in the java source.
+    the pipes are binary, since the payloads are framed by their lengths in bytes.
+    """
+    max_restarts = 3
+
+    def __init__(self, jar, timeout=60):
         self.jar = jar
+        self.timeout = timeout
+        self._process: Optional[subprocess.Popen] = None
+        self._responses: queue.Queue = queue.Queue()
+        self._restarts = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        command = ["java", "-cp", str(self.jar), str(WORKER_SOURCE), str(self.jar)]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         stderr=subprocess.DEVNULL)
+        self._responses = queue.Queue()
+        threading.Thread(target=self._read, args=(self._process, self._responses), daemon=True).start()
+        try:
+            status, content = self._call(b"PING\n", 30)
+        except (queue.Empty, OSError):
+            status, content = None, None
+        if status != "PONG":
+            self.stop(force=True)
+            # e.g. the jdk does not allow trapping System.exit of acts
+            raise RuntimeError(f"acts worker cannot start: {content}" if status == "ERR"
+                               else "acts worker does not respond")
+        logger.debug(f"acts worker started, pid: {self._process.pid}")
+
+    @staticmethod
+    def _read(process, responses):
+        for line in process.stdout:
+            line = line.rstrip(b"\r\n").decode("utf-8", errors="replace")
+            if line.startswith("OK "):
+                responses.put(("OK", process.stdout.read(int(line[3:])).decode("utf-8")))
+            elif line.startswith("ERR "):
+                responses.put(("ERR", line[4:]))
+            else:
+                responses.put((line, None))
+        responses.put(("EOF", None))
+
+    def _call(self, message: bytes, timeout):
+        self._process.stdin.write(message)
+        self._process.stdin.flush()
+        return self._responses.get(timeout=timeout)
+
+    def is_alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def restart(self):
+        if self._restarts >= self.max_restarts:
+            raise RuntimeError("acts worker crashed too many times")
+        self._restarts += 1
+        logger.warning(f"restart acts worker: {self._restarts}/{self.max_restarts}")
+        self.stop()
+        self.start()
+
+    def generate(self, strength, model: str) -> List[str]:
+        with self._lock:
+            if not self.is_alive():
+                self.restart()
+            try:
+                model = model.encode("utf-8")
+                status, content = self._call(f"REQ {strength} {len(model)}\n".encode("utf-8") + model, self.timeout)
+            except queue.Empty:
+                self.stop(force=True)
+                raise TimeoutError(f"acts worker does not return in {self.timeout} seconds")
+            except OSError as e:
+                self.stop()
+                raise RuntimeError(f"acts worker crashed: {e}")
+            if status == "OK":
+                return content.splitlines()
+            elif status == "ERR":
+                raise RuntimeError(f"acts worker error: {content}")
+            else:
+                self.stop()
+                raise RuntimeError(f"acts worker crashed: {status}")
+
+    def stop(self, force=False):
+        if self._process is None:
+            return
+        try:
+            if force:
+                self._process.kill()
+            elif self._process.poll() is None:
+                self._process.stdin.write(b"EXIT\n")
+                self._process.stdin.flush()
+                self._process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self._process.kill()
+        self._process = None
+
+
+class CoveringArrayCache:
+    """
+    LRU cache of covering arrays (value indexes) keyed by the index-level model,
+    optionally persisted as json so that later runs against the same spec start warm.
+    It is shared by the workers, so the arrays are only touched under the lock.
+    """
+
+    def __init__(self, capacity=1024, path: Optional[Path] = None):
+        self._capacity = capacity
+        self._path = path
+        self._arrays: OrderedDict = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+        if self._path is not None and self._path.exists():
+            try:
+                with self._path.open("r") as fp:
+                    self._arrays.update(json.load(fp))
+            except (OSError, ValueError) as e:
+                logger.warning(f"cannot load covering array cache {self._path}: {e}")
+            self._shrink()
+
+    @staticmethod
+    def key(sizes: List[int], acts_constraints: List[str], strength: int) -> str:
+        model = json.dumps([sizes, acts_constraints, strength], separators=(",", ":"))
+        return hashlib.sha1(model.encode("utf-8")).hexdigest()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._arrays
+
+    def get(self, key) -> Optional[List[List[int]]]:
+        with self._lock:
+            rows = self._arrays.get(key)
+            if rows is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._arrays.move_to_end(key)
+            return rows
+
+    def put(self, key, rows: List[List[int]]):
+        if self._capacity <= 0:
+            return
+        with self._lock:
+            self._arrays[key] = rows
+            self._arrays.move_to_end(key)
+            self._shrink()
+
+    def _shrink(self):
+        while len(self._arrays) > max(self._capacity, 0):
+            self._arrays.popitem(last=False)
+
+    def get_state(self) -> OrderedDict:
+        with self._lock:
+            return OrderedDict(self._arrays)
+
+    def set_state(self, arrays: OrderedDict):
+        with self._lock:
+            self._arrays = OrderedDict(arrays)
+            self._shrink()
+
+    def save(self):
+        if self._path is None:
+            return
+        tmp = self._path.with_suffix(".tmp")
+        with tmp.open("w") as fp:
+            json.dump(self.get_state(), fp)
+        os.replace(tmp, self._path)
+        logger.debug(f"covering array cache saved: {len(self._arrays)}, hits: {self.hits}, misses: {self.misses}")
+
+
+def generate_ipog(sizes: List[int], strength: int, acts_constraints: List[str]) -> List[List[int]]:
+    """module level entry of ipog, so that it can be sent to a process pool"""
+    return IPOG(sizes, strength, acts_constraints).generate()
+
+
+class ACTS:
+    def __init__(self, config):
+        self._workplace = Path(config.data_path) / "acts"
+        self.jar = config.jar
+        # ipog: generate covering arrays in process, acts: call the acts jar
+        self.engine = config.engine
+        self._worker: Optional[ActsWorker] = None
         if not self._workplace.exists():
             self._workplace.mkdir()
+        self._cache = CoveringArrayCache(config.cache_size,
+                                         self._workplace / "cache.json" if config.cache_persist else None)
+
+        # covering arrays of the upcoming operations are generated in background
+        self._pool: Optional[Executor] = None
+        self._use_processes = False
+        if config.ca_workers > 0:
+            if config.ca_pool == "process" and self.engine == "ipog":
+                # the workers are spawned, forking a process which runs threads (http pool, writers) may deadlock
+                self._pool = ProcessPoolExecutor(config.ca_workers, mp_context=multiprocessing.get_context("spawn"))
+                self._use_processes = True
+            else:
+                self._pool = ThreadPoolExecutor(config.ca_workers, thread_name_prefix="acts")
+        self._pending: Dict[str, Future] = dict()
+        # counting the covered combinations takes a pass for each t-way combination of columns
+        self._coverage_stats = config.coverage_stats
+        # guards the pending covering arrays, which are prefetched and picked up by several workers
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self) -> CoveringArrayCache:
+        return self._cache
+
+    @property
+    def can_prefetch(self) -> bool:
+        """whether covering arrays are generated in background, ca_workers 0 disables it"""
+        return self._pool is not None
+
+    def start_worker(self, timeout=60):
+        if self.jar is None:
+            return
+        worker = ActsWorker(self.jar, timeout)
+        try:
+            worker.start()
+        except (OSError, RuntimeError) as e:
+            logger.warning(f"cannot start acts worker, call acts for each covering array: {e}")
+        else:
+            self._worker = worker
+
+    def stop_worker(self):
+        if self._worker is not None:
+            self._worker.stop()
+            self._worker = None
 
     @staticmethod
     def get_id(operation, param_name, domain_map):
@@ -44,30 +277,30 @@ class ACTS:
             cStr = re.sub(re.compile(pattern), paramId, cStr)
         return eval(cStr)
 
-    def writeInput(self, operation, domain_map, param_names, constraints, strength) -> Path:
-        inputFile = self._workplace / "input.txt"
-        with inputFile.open("w") as fp:
-            fp.write(
-                "\n".join(
-                    ['[System]', '-- specify system name', 'Name: {}'.format("acts" + str(strength)), '',
-                     '[Parameter]', '-- general syntax is parameter_name(type): value1, value2...\n'])
-            )
-            # write parameter ids
-            for paramName, domain in domain_map.items():
-                fp.write("{}(int):{}\n".format(self.get_id(operation, paramName, param_names),
-                                               ",".join([str(i) for i in range(len(domain))])))
-
-            fp.write("\n")
-            # write constraints
-            if len(constraints) > 0:
-                fp.write("[Constraint]\n")
-                for c in constraints:
-                    [fp.write(ts + "\n") for ts in self.transformConstraint(operation, domain_map, param_names, c)]
+    def buildInput(self, operation, domain_map, param_names, acts_constraints: List[str], strength) -> str:
+        lines = ['[System]', '-- specify system name', 'Name: {}'.format("acts" + str(strength)), '',
+                 '[Parameter]', '-- general syntax is parameter_name(type): value1, value2...']
+        # write parameter ids
+        for paramName, domain in domain_map.items():
+            lines.append("{}(int):{}".format(self.get_id(operation, paramName, param_names),
+                                             ",".join([str(i) for i in range(len(domain))])))
 
+        lines.append("")
+        # write constraints
+        if len(acts_constraints) > 0:
+            lines.append("[Constraint]")
+            lines.extend(acts_constraints)
+        return "\n".join(lines) + "\n"
+
+    def writeInput(self, workspace: Path, operation, domain_map, param_names, acts_constraints: List[str],
+                   strength) -> Path:
+        inputFile = workspace / "input.txt"
+        with inputFile.open("w") as fp:
+            fp.write(self.buildInput(operation, domain_map, param_names, acts_constraints, strength))
         return inputFile
 
-    def callActs(self, strength: int, inputFile) -> Path:
-        outputFile = self._workplace / "output.txt"
+    def callActs(self, workspace: Path, strength: int, inputFile) -> Path:
+        outputFile = workspace / "output.txt"
         jarPath = Path(self.jar)
         algorithm = "ipog"
 
@@ -78,31 +311,119 @@ class ACTS:
                                                                                     str(outputFile))
         stdout, stderr = subprocess.Popen(shlex.split(command, posix=False), stdout=subprocess.PIPE,
                                           stderr=subprocess.PIPE).communicate()
+        import chardet
+
         encoding = chardet.detect(stdout)["encoding"]
         stdout.decode(encoding)
         return outputFile
 
-    def parseOutput(self, outputFile: Path, domain_map, param_names, history_ca_of_current_op: List[dict]):
+    def parseOutput(self, outputFile: Path, param_names) -> List[List[int]]:
         with outputFile.open("r") as fp:
-            lines = [line.strip("\n") for line in fp.readlines() if "#" not in line and len(line.strip("\n")) > 0]
-        param_names = [self.get_name(paramId, param_names) for paramId in lines[0].strip("\n").split(",")]
-        coverArray: List[Dict[str, Value]] = list()
+            return self.parseLines(fp.readlines(), param_names)
+
+    def parseLines(self, lines, param_names) -> List[List[int]]:
+        """read the acts output, the columns are reordered as the parameters in param_names"""
+        lines = [line.strip("\n") for line in lines if "#" not in line and len(line.strip("\n")) > 0]
+        columns = [param_names.index(self.get_name(paramId, param_names))
+                   for paramId in lines[0].strip("\n").split(",")]
+        rows = list()
         for line in lines[1:]:
-            valueDict = dict()
-            valueIndexList = line.strip("\n").split(",")
-            for i, valueIndex in enumerate(valueIndexList):
-                valueDict[param_names[i]] = domain_map[param_names[i]][int(valueIndex)]
-            if "history_ca_of_current_op" in valueDict.keys():
-                history_index = valueDict.pop("history_ca_of_current_op")
-                valueDict.update(history_ca_of_current_op[history_index.val])
-            coverArray.append(valueDict)
+            row = [0] * len(param_names)
+            for column, valueIndex in zip(columns, line.strip("\n").split(",")):
+                row[column] = int(valueIndex)
+            rows.append(row)
+        return rows
 
-        return coverArray
+    @staticmethod
+    def to_cover_array(param_names, rows, domain_map, history_ca_of_current_op: List[dict]) -> CoveringArray:
+        return CoveringArray.of(param_names, rows, domain_map, history_ca_of_current_op)
 
-    def process(self, operation, domain_map, constraints: List[Constraint], strength: int,
-                history_ca_of_current_op: List[dict]):
+    def generate(self, operation, domain_map, param_names, acts_constraints: List[str], strength) -> List[List[int]]:
+        if self.engine == "ipog":
+            try:
+                return generate_ipog([len(domain) for domain in domain_map.values()], strength, acts_constraints)
+            except Exception as e:
+                if self.jar is None:
+                    raise
+                logger.warning(f"call ipog wrong, fall back to acts: {e}")
+        if self._worker is not None:
+            try:
+                model = self.buildInput(operation, domain_map, param_names, acts_constraints, strength)
+                return self.parseLines(self._worker.generate(strength, model), param_names)
+            except (TimeoutError, RuntimeError) as e:
+                logger.warning(f"call acts worker wrong, call acts directly: {e}")
+        # each call has its own workspace, so that covering arrays can be generated in parallel
+        with tempfile.TemporaryDirectory(dir=self._workplace) as workspace:
+            workspace = Path(workspace)
+            inputFile = self.writeInput(workspace, operation, domain_map, param_names, acts_constraints, strength)
+            outputFile = self.callActs(workspace, strength, inputFile)
+            return self.parseOutput(outputFile, param_names)
+
+    def _model(self, operation, domain_map, constraints: List[Constraint], strength: int):
         strength = min(strength, len(domain_map.keys()))
         param_names = list(domain_map.keys())
-        inputFile = self.writeInput(operation, domain_map, param_names, constraints, strength)
-        outputFile = self.callActs(strength, inputFile)
-        return self.parseOutput(outputFile, domain_map, param_names, history_ca_of_current_op)
+        acts_constraints = list()
+        for c in constraints:
+            acts_constraints.extend(self.transformConstraint(operation, domain_map, param_names, c))
+
+        # the covering array only depends on the domain sizes, constraints and strength
+        key = CoveringArrayCache.key([len(domain) for domain in domain_map.values()], acts_constraints, strength)
+        return key, param_names, acts_constraints, strength
+
+    def prefetch(self, operation, domain_map, constraints: List[Constraint], strength: int):
+        """generate the covering array in background, it is picked up by process if the model does not change"""
+        if self._pool is None or len(domain_map) == 0:
+            return
+        key, param_names, acts_constraints, strength = self._model(operation, domain_map, constraints, strength)
+        with self._lock:
+            self._collect()
+            if key in self._pending or key in self._cache:
+                return
+            if self._use_processes:
+                sizes = [len(domain) for domain in domain_map.values()]
+                self._pending[key] = self._pool.submit(generate_ipog, sizes, strength, acts_constraints)
+            else:
+                domain_map = {p: list(domain) for p, domain in domain_map.items()}
+                self._pending[key] = self._pool.submit(self.generate, operation, domain_map, param_names,
+                                                       acts_constraints, strength)
+
+    def _collect(self):
+        """move the finished background covering arrays into the cache, called under the lock"""
+        for key in [key for key, future in self._pending.items() if future.done()]:
+            future = self._pending.pop(key)
+            if future.exception() is None:
+                self._cache.put(key, future.result())
+
+    def process(self, operation, domain_map, constraints: List[Constraint], strength: int,
+                history_ca_of_current_op: List[dict]):
+        key, param_names, acts_constraints, strength = self._model(operation, domain_map, constraints, strength)
+        rows = self._cache.get(key)
+        with self._lock:
+            future = self._pending.pop(key, None) if rows is None else None
+        if future is not None:
+            try:
+                rows = future.result()
+                logger.debug("        use prefetched covering array: {}", key)
+            except Exception as e:
+                logger.warning(f"prefetch covering array wrong: {e}")
+        elif rows is not None:
+            logger.debug("        use cached covering array: {}", key)
+        if rows is None:
+            rows = self.generate(operation, domain_map, param_names, acts_constraints, strength)
+        self._cache.put(key, rows)
+        cover_array = self.to_cover_array(param_names, rows, domain_map, history_ca_of_current_op)
+        if self._coverage_stats:
+            logger.info(f"        {strength}-way combinations covered (constraints ignored): "
+                        f"{cover_array.count_covered(strength)}/{cover_array.count_combinations(strength)}")
+        return cover_array
+
+    def close(self):
+        if self._pool is not None:
+            with self._lock:
+                for future in self._pending.values():
+                    future.cancel()
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        self._pending.clear()
+        self.stop_worker()
+        self._cache.save()
@@ -1,15 +1,148 @@
-from collections import defaultdict
+from bisect import insort
+from collections import defaultdict, deque
+from collections.abc import Mapping
 
 import csv
+import hashlib
 import json
-from typing import List, Dict, Tuple, Set
+from typing import List, Dict, Tuple, Set, Deque, Optional
 
-from src.factor import Value, ValueType, AbstractFactor
+from src.covering import CoveringArray
+from src.factor import Value, ValueType, AbstractFactor, ResponseIndex
 from src.keywords import DataType
 from src.rest import RestOp
+from src.writer import JsonLinesWriter
+
+
+class ChainNode(Mapping):
+    """
+    response chain which shares the nodes of the chain it extends, it maps the operations to their responses,
+    and the latest response of an operation hides the earlier ones
+    """
+    __slots__ = ("parent", "operation", "response", "_length", "_depth")
+
+    def __init__(self, parent=None, operation: RestOp = None, response=None):
+        self.parent: Optional[ChainNode] = parent
+        self.operation = operation
+        self.response = response
+        if parent is None:
+            self._length = 0
+            self._depth = 0
+        else:
+            self._length = len(parent) + (0 if operation in parent else 1)
+            self._depth = parent._depth + 1
+
+    @staticmethod
+    def of(items) -> "ChainNode":
+        """chain of the (operation, response) items from the root"""
+        chain = ChainNode()
+        for operation, response in items:
+            chain = ChainNode(chain, operation, response)
+        return chain
+
+    def extend(self, operation: RestOp, response):
+        chain = ChainNode(self, operation, response)
+        # the hidden responses are dropped once there are more of them than the visible ones
+        if chain._depth > 2 * len(chain):
+            chain = ChainNode.of((op, chain[op]) for op in chain)
+        return chain
+
+    def _nodes(self) -> list:
+        nodes = list()
+        node = self
+        while node.parent is not None:
+            nodes.append(node)
+            node = node.parent
+        nodes.reverse()
+        return nodes
+
+    def __reduce__(self):
+        """pickled as the items from the root, nested nodes of a long chain exceed the recursion limit of pickle"""
+        return ChainNode.of, ([(node.operation, node.response) for node in self._nodes()],)
+
+    def _node_of(self, operation):
+        node = self
+        while node.parent is not None:
+            if node.operation == operation:
+                return node
+            node = node.parent
+        return None
+
+    def __getitem__(self, operation):
+        node = self._node_of(operation)
+        if node is None:
+            raise KeyError(operation)
+        return node.response
+
+    def __contains__(self, operation):
+        return self._node_of(operation) is not None
+
+    def __iter__(self):
+        """operations in the order they were first added, as the keys of a dict"""
+        seen = set()
+        for node in self._nodes():
+            if node.operation not in seen:
+                seen.add(node.operation)
+                yield node.operation
+
+    def __len__(self):
+        return self._length
+
+
+class ChainStore:
+    """
+    the latest response chains, the oldest one is dropped when there are more than max_size of them,
+    and the chains are grouped by their lengths so that the longest ones are picked without sorting
+    """
+
+    def __init__(self, max_size: int = 10):
+        self._max_size = max_size
+        self._chains: Deque[ChainNode] = deque()
+        self._by_length: Dict[int, Deque[ChainNode]] = dict()
+        # lengths of the groups in ascending order
+        self._lengths: List[int] = list()
+
+    def add(self, chain: ChainNode) -> Optional[ChainNode]:
+        """save the chain, and return the dropped one if any"""
+        self._chains.append(chain)
+        if len(chain) not in self._by_length:
+            self._by_length[len(chain)] = deque()
+            insort(self._lengths, len(chain))
+        self._by_length[len(chain)].append(chain)
+
+        if len(self._chains) <= self._max_size:
+            return None
+        oldest = self._chains.popleft()
+        group = self._by_length[len(oldest)]
+        # the oldest chain is also the oldest one of its group
+        group.popleft()
+        if len(group) == 0:
+            del self._by_length[len(oldest)]
+            self._lengths.remove(len(oldest))
+        return oldest
+
+    def longest(self, n: int) -> List[ChainNode]:
+        """the n longest chains, the older one comes first when two chains have the same length"""
+        chains = list()
+        for length in reversed(self._lengths):
+            for chain in self._by_length[length]:
+                if len(chains) == n:
+                    return chains
+                chains.append(chain)
+        return chains
+
+    def __iter__(self):
+        return iter(self._chains)
+
+    def __len__(self):
+        return len(self._chains)
 
 
 class RuntimeInfoManager:
+    # attributes which are not saved in checkpoints, the response indexes are keyed by the ids of the responses,
+    # which change when a checkpoint is loaded, so they are built again from the chains
+    _transient = ("_config", "_writers", "_response_indexes")
+
     def __init__(self, config):
         self._config = config
         self._num_of_requests = 0
@@ -17,8 +150,11 @@ class RuntimeInfoManager:
         self.call_time = 0
         self.prompt_tokens = 0
         self.cost = 0
-        self._response_chains: List[Dict[RestOp, object]] = [dict()]
+        self._response_chains: ChainStore = ChainStore(10)
+        self._response_chains.add(ChainNode())
         self._response_dict: Dict[RestOp, List[object]] = dict()
+        # flattened keys of the responses in the chains, keyed by the id of the response
+        self._response_indexes: Dict[int, ResponseIndex] = dict()
         self._unresolved_params: Set[Tuple[RestOp, str]] = set()
 
         self._param_to_ask: Dict[RestOp, Set[AbstractFactor]] = dict()
@@ -28,58 +164,74 @@ class RuntimeInfoManager:
         self._path_binding: Dict[RestOp, Dict[AbstractFactor, List[RestOp]]] = dict()
         self._param_binding: Dict[RestOp, Dict[AbstractFactor, Dict[RestOp, str]]] = dict()
 
-        self._reused_essential_seq_dict: Dict[Tuple[RestOp], List[Dict[str, Value]]] = defaultdict(list)
-        self._reused_all_p_seq_dict: dict = defaultdict(list)
+        self._reused_essential_seq_dict: Dict[Tuple[RestOp], CoveringArray] = dict()
+        self._reused_all_p_seq_dict: Dict[Tuple[RestOp], CoveringArray] = dict()
         self._ok_value_dict: Dict[str, List[Value]] = defaultdict(list)
         self._success_sequence: set = set()
         self._success_operations: set = set()
 
-        self._response_list = dict()
+        # error responses and test cases are appended to json lines files once they are saved,
+        # only the digests of the error responses are kept to skip the duplicate ones
+        self._response_digests: Set[bytes] = set()
+        self._writers: Dict[str, JsonLinesWriter] = dict()
         self._example_value_dict: Dict[str, Dict[str, List[str, int]]] = dict()
-        self._test_case_dict = dict()
 
-    def get_chains(self, max_chain_items):
-        sortedList = sorted(self._response_chains, key=lambda c: len(c.keys()), reverse=True)
-        return sortedList[:max_chain_items] if max_chain_items < len(sortedList) else sortedList
+        # requests, new connections and reused connections of the http connection pool
+        self._pool_statistics: Dict[str, int] = dict()
+
+    def get_chains(self, max_chain_items) -> List[ChainNode]:
+        return self._response_chains.longest(max_chain_items)
 
-    def get_reused_with_essential_p(self, operations: Tuple[RestOp]):
-        reused_case = self._reused_essential_seq_dict.get(operations, list())
-        if len(reused_case) > 0:
-            return [{p: Value(v.val, ValueType.Reused, v.type) for p, v in case.items()} for case in reused_case]
-        return []
+    def get_reused_with_essential_p(self, operations: Tuple[RestOp]) -> CoveringArray:
+        reused_case = self._reused_essential_seq_dict.get(operations)
+        if reused_case is not None and len(reused_case) > 0:
+            return reused_case.with_generator(ValueType.Reused)
+        return CoveringArray.empty(0)
 
-    def get_reused_with_all_p(self, operations: Tuple[RestOp]):
-        reused_case = self._reused_all_p_seq_dict.get(operations, list())
-        if len(reused_case) > 0:
-            return [{p: Value(v.val, ValueType.Reused, v.type) for p, v in case.items()} for case in reused_case]
-        return []
+    def get_reused_with_all_p(self, operations: Tuple[RestOp]) -> CoveringArray:
+        reused_case = self._reused_all_p_seq_dict.get(operations)
+        if reused_case is not None and len(reused_case) > 0:
+            return reused_case.with_generator(ValueType.Reused)
+        return CoveringArray.empty(0)
 
     def is_unresolved(self, p_name):
         return p_name in self._unresolved_params
 
-    def save_reuse(self, url_tuple, is_essential, case):
+    def save_reuse(self, url_tuple, is_essential, cases: CoveringArray):
+        """keep at most 10 distinct successful cases for each sequence"""
         if is_essential:
             to_dict = self._reused_essential_seq_dict
         else:
             to_dict = self._reused_all_p_seq_dict
-        if len(to_dict[url_tuple]) < 10:
-            to_dict[url_tuple].append(case)
-
-    def save_ok_value(self, case):
-        for paramStr, value in case.items():
-            if paramStr not in self._ok_value_dict.keys():
-                self._ok_value_dict[paramStr].append(value)
-            else:
-                lst = self._ok_value_dict.get(paramStr)
-                if len(lst) < 10 and value not in lst:
-                    lst.append(value)
-
-    def save_chain(self, chain, operation, response):
-        new_chain = chain.copy()
-        new_chain[operation] = response
-        self._response_chains.append(new_chain)
-        if len(self._response_chains) > 10:
-            self._response_chains.pop(0)
+        reused_case = to_dict.get(url_tuple)
+        if reused_case is not None:
+            if len(reused_case) >= 10:
+                return
+            cases = CoveringArray.concat([reused_case, cases])
+        to_dict[url_tuple] = cases.unique().select(slice(0, 10)).compact()
+
+    def save_ok_value(self, cases: CoveringArray):
+        for column, paramStr in enumerate(cases.names):
+            for value in cases.used_values(column):
+                if paramStr not in self._ok_value_dict.keys():
+                    self._ok_value_dict[paramStr].append(value)
+                else:
+                    lst = self._ok_value_dict.get(paramStr)
+                    if len(lst) < 10 and value not in lst:
+                        lst.append(value)
+
+    def save_chain(self, chain: ChainNode, operation, response):
+        self._response_indexes[id(response)] = ResponseIndex(response)
+        if self._response_chains.add(chain.extend(operation, response)) is not None:
+            alive = {id(r) for c in self._response_chains for r in c.values()}
+            for key in [key for key in self._response_indexes.keys() if key not in alive]:
+                del self._response_indexes[key]
+
+    def response_index(self, response) -> ResponseIndex:
+        index = self._response_indexes.get(id(response))
+        if index is None or index.response is not response:
+            index = ResponseIndex(response)
+        return index
 
     def save_success_response(self, operation, response):
         if self._response_dict.get(operation) is None:
@@ -117,14 +269,13 @@ class RuntimeInfoManager:
     def save_success_seq(self, url_tuple):
         self._success_sequence.add(url_tuple)
 
-    def save_response(self, op, response_list, ca):
+    def save_response(self, op, response_list, cas: List[CoveringArray]):
         value_set = set()
-        for v_dict in ca:
-            for p, v in v_dict.items():
-                if v.type == DataType.String and v.val is not None and v.val != "":
-                    value_set.add(v.val)
-        if self._response_list.get(op.__repr__()) is None:
-            self._response_list[op.__repr__()] = set()
+        for ca in cas:
+            for column in range(len(ca.names)):
+                for v in ca.used_values(column):
+                    if v.type == DataType.String and v.val is not None and v.val != "":
+                        value_set.add(v.val)
         for sc, response in response_list:
             if sc >= 400:
                 response = json.dumps(response)
@@ -133,26 +284,47 @@ class RuntimeInfoManager:
                     if v in response and len(v) > 1:
                         response = response.replace(v, "*")
                         break
-                self._response_list[op.__repr__()].add(response)
+                self._save_error_response(op, response)
 
-    def save_response_to_file(self):
-        save_path = f"{self._config.data_path}/response.json"
-        save_list = dict()
-        for op, response_set in self._response_list.items():
-            save_list[op] = list(response_set)
-        with open(save_path, 'w') as f:
-            json.dump(save_list, f, indent=2)
+    def _save_error_response(self, op, response: str):
+        digest = hashlib.md5(f"{op.__repr__()}\n{response}".encode("utf-8")).digest()
+        if digest not in self._response_digests:
+            self._response_digests.add(digest)
+            self._writer("response").write({"operation": op.__repr__(), "response": response})
 
     def save_case_response(self, op, case, response_data, status_code):
-        if self._test_case_dict.get(op.__repr__()) is None:
-            self._test_case_dict[op.__repr__()] = list()
-        self._test_case_dict[op.__repr__()].append((case, response_data, status_code))
+        self._writer("case_response").write({"operation": op.__repr__(), "case": case, "response": response_data,
+                                             "status_code": status_code})
 
-    def save_case_response_to_file(self):
-        save_path = f"{self._config.data_path}/case_response.json"
-        with open(save_path, 'w') as f:
-            json.dump(self._test_case_dict, f, indent=2)
+    def _writer(self, name) -> JsonLinesWriter:
+        """writer of <data_path>/<name>.jsonl, opened when the first record is saved"""
+        if name not in self._writers:
+            self._writers[name] = JsonLinesWriter(f"{self._config.data_path}/{name}.jsonl", self._config.compress)
+        return self._writers[name]
+
+    def flush(self):
+        for writer in self._writers.values():
+            writer.flush()
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+    def get_state(self) -> dict:
+        """runtime data saved in checkpoints"""
+        self.flush()
+        return {k: v for k, v in self.__dict__.items() if k not in self._transient}
 
+    def set_state(self, state: dict):
+        self.__dict__.update({k: v for k, v in state.items() if k not in self._transient})
+        self._response_indexes = {id(r): ResponseIndex(r) for chain in self._response_chains for r in chain.values()}
+
+    def save_pool_statistics(self, statistics: Dict[str, int]):
+        self._pool_statistics = statistics
+
+    def get_pool_statistics(self) -> Dict[str, int]:
+        return self._pool_statistics
 
     def save_problem_param(self, operation, param_list):
         if self._param_to_ask.get(operation) is None:
@@ -228,12 +400,12 @@ class RuntimeInfoManager:
             if int(sc) < 400:
                 case = ca[index]
                 for p, v in case.items():
-                    for f in operation.get_leaf_factors():
-                        if f.get_global_name == p and v.val in f.llm_examples:
-                            if self._example_value_dict[operation.__repr__()].get(p) is None:
-                                self._example_value_dict[operation.__repr__()][p] = list()
-                            if v.val not in self._example_value_dict[operation.__repr__()][p]:
-                                self._example_value_dict[operation.__repr__()][p].append(v.val)
+                    f = operation.get_leaf(p)
+                    if f is not None and v.val in f.llm_examples:
+                        if self._example_value_dict[operation.__repr__()].get(p) is None:
+                            self._example_value_dict[operation.__repr__()][p] = list()
+                        if v.val not in self._example_value_dict[operation.__repr__()][p]:
+                            self._example_value_dict[operation.__repr__()][p].append(v.val)
 
     def save_value_to_file(self):
         save_path = f"{self._config.data_path}/example_value.json"
@@ -268,3 +440,36 @@ class RuntimeInfoManager:
 
     def get_param_binding(self, operation):
         return self._param_binding.get(operation, dict())
+
+
+class WorkerInfoManager:
+    """
+    runtime manager of one worker when sequences are tested by several workers,
+    the response chains and the http pool statistics belong to the worker,
+    and the other runtime data are shared through the manager, guarded by the lock
+    """
+
+    def __init__(self, manager: RuntimeInfoManager, lock):
+        self._manager = manager
+        self._lock = lock
+        self._response_chains: ChainStore = ChainStore(10)
+        self._response_chains.add(ChainNode())
+        self._response_indexes: Dict[int, ResponseIndex] = dict()
+        self._pool_statistics: Dict[str, int] = dict()
+
+    get_chains = RuntimeInfoManager.get_chains
+    save_chain = RuntimeInfoManager.save_chain
+    response_index = RuntimeInfoManager.response_index
+    save_pool_statistics = RuntimeInfoManager.save_pool_statistics
+    get_pool_statistics = RuntimeInfoManager.get_pool_statistics
+
+    def __getattr__(self, name):
+        attr = getattr(self._manager, name)
+        if not callable(attr):
+            return attr
+
+        def locked(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+
+        return locked
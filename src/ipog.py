@@ -0,0 +1,349 @@
+import heapq
+import random
+import re
+from itertools import combinations, product
+from operator import itemgetter
+from typing import List, Optional, Dict, Set, Tuple, Callable
+
+from loguru import logger
+
+
+class ActsConstraint:
+    """
+    constraint written in the acts syntax, e.g. (P0 = 1 || P0 = 2) => (P3 != 2)
+    parameters are referred by their ids (P0, P1, ...) and values by their indexes in the domains
+    """
+    _TOKEN = re.compile(r"\s*(=>|&&|\|\||!=|>=|<=|=|>|<|!|\(|\)|P\d+|-?\d+|'[^']*'|\"[^\"]*\"|\w+)")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.params: Set[int] = set()
+        self._tokens = self._tokenize(text)
+        self._pos = 0
+        self._evaluate = self._parse_implication()
+        if self._pos != len(self._tokens):
+            raise ValueError(f"Unexpected token '{self._tokens[self._pos]}' in constraint: {text}")
+        del self._tokens
+
+    def _tokenize(self, text):
+        tokens = []
+        pos = 0
+        text = text.strip()
+        while pos < len(text):
+            matcher = self._TOKEN.match(text, pos)
+            if matcher is None:
+                raise ValueError(f"Cannot tokenize constraint: {text}")
+            tokens.append(matcher.group(1))
+            pos = matcher.end()
+        return tokens
+
+    def _peek(self):
+        return self._tokens[self._pos] if self._pos < len(self._tokens) else None
+
+    def _next(self):
+        token = self._peek()
+        if token is None:
+            raise ValueError(f"Unexpected end of constraint: {self.text}")
+        self._pos += 1
+        return token
+
+    def _parse_implication(self):
+        left = self._parse_or()
+        if self._peek() == "=>":
+            self._next()
+            right = self._parse_implication()
+            return lambda row: not left(row) or right(row)
+        return left
+
+    def _parse_or(self):
+        operands = [self._parse_and()]
+        while self._peek() == "||":
+            self._next()
+            operands.append(self._parse_and())
+        if len(operands) == 1:
+            return operands[0]
+        return lambda row: any(o(row) for o in operands)
+
+    def _parse_and(self):
+        operands = [self._parse_not()]
+        while self._peek() == "&&":
+            self._next()
+            operands.append(self._parse_not())
+        if len(operands) == 1:
+            return operands[0]
+        return lambda row: all(o(row) for o in operands)
+
+    def _parse_not(self):
+        if self._peek() == "!":
+            self._next()
+            operand = self._parse_not()
+            return lambda row: not operand(row)
+        return self._parse_relation()
+
+    def _parse_relation(self):
+        if self._peek() == "(":
+            self._next()
+            expression = self._parse_implication()
+            if self._next() != ")":
+                raise ValueError(f"Missing closing ) in constraint: {self.text}")
+            return expression
+
+        left = self._parse_term()
+        op = self._next()
+        right = self._parse_term()
+        if op == "=":
+            return lambda row: left(row) == right(row)
+        elif op == "!=":
+            return lambda row: left(row) != right(row)
+        elif op == ">":
+            return lambda row: left(row) > right(row)
+        elif op == ">=":
+            return lambda row: left(row) >= right(row)
+        elif op == "<":
+            return lambda row: left(row) < right(row)
+        elif op == "<=":
+            return lambda row: left(row) <= right(row)
+        else:
+            raise ValueError(f"Unsupported operator '{op}' in constraint: {self.text}")
+
+    def _parse_term(self):
+        token = self._next()
+        if re.fullmatch(r"P\d+", token):
+            index = int(token[1:])
+            self.params.add(index)
+            return lambda row: row[index]
+        elif re.fullmatch(r"-?\d+", token):
+            value = int(token)
+            return lambda row: value
+        else:
+            raise ValueError(f"Unknown parameter or value '{token}' in constraint: {self.text}")
+
+    def is_satisfied(self, row) -> bool:
+        """a constraint is only evaluated when all its parameters have been assigned"""
+        if any(row[p] is None for p in self.params):
+            return True
+        return self._evaluate(row)
+
+
+class IPOG:
+    """
+    in-process implementation of the IPOG strategy (Lei et al.), used to generate t-way covering arrays
+    without calling the acts jar.
+    """
+
+    def __init__(self, sizes: List[int], strength: int, constraints: List[str]):
+        self._sizes = sizes
+        self._n = len(sizes)
+        self._strength = min(strength, self._n)
+
+        self._constraints: List[ActsConstraint] = list()
+        for c in constraints:
+            try:
+                constraint = ActsConstraint(c)
+            except ValueError as e:
+                logger.warning(f"ignore constraint: {e}")
+                continue
+            if any(p >= self._n for p in constraint.params):
+                logger.warning(f"ignore constraint with unknown parameters: {c}")
+                continue
+            self._constraints.append(constraint)
+
+        self._constraints_of: Dict[int, List[ActsConstraint]] = {p: [] for p in range(self._n)}
+        for c in self._constraints:
+            for p in c.params:
+                self._constraints_of[p].append(c)
+        self._constrained = sorted({p for c in self._constraints for p in c.params})
+        # whether a row can be completed only depends on the values of the constrained parameters
+        self._completable: Dict[Tuple, bool] = dict()
+
+    def _is_consistent(self, row, changed=None) -> bool:
+        """check the assigned values of the row, and whether the constrained parameters can still be completed"""
+        if len(self._constraints) == 0:
+            return True
+        to_check = self._constraints if changed is None else [c for p in changed for c in self._constraints_of[p]]
+        if not all(c.is_satisfied(row) for c in to_check):
+            return False
+        key = tuple(row[p] for p in self._constrained)
+        completable = self._completable.get(key)
+        if completable is None:
+            completable = self._complete(list(row)) is not None
+            self._completable[key] = completable
+        return completable
+
+    def _complete(self, row) -> Optional[list]:
+        """assign the unassigned constrained parameters with a backtracking search"""
+        free = [p for p in self._constrained if row[p] is None]
+        return row if self._search(row, free, 0) else None
+
+    def _search(self, row, free, index) -> bool:
+        if index == len(free):
+            return True
+        p = free[index]
+        values = list(range(self._sizes[p]))
+        random.shuffle(values)
+        for v in values:
+            row[p] = v
+            if all(c.is_satisfied(row) for c in self._constraints_of[p]) and self._search(row, free, index + 1):
+                return True
+        row[p] = None
+        return False
+
+    def _uncovered_with(self, k) -> Dict[Tuple[int], Set[Tuple[int]]]:
+        """all valid t-way value combinations of parameter k and t-1 parameters before it"""
+        uncovered = dict()
+        for columns in combinations(range(k), self._strength - 1):
+            columns = columns + (k,)
+            combs = set()
+            for values in product(*[range(self._sizes[c]) for c in columns]):
+                if len(self._constraints) > 0:
+                    row = [None] * self._n
+                    for c, v in zip(columns, values):
+                        row[c] = v
+                    if not self._is_consistent(row, columns):
+                        continue
+                combs.add(values)
+            uncovered[columns] = combs
+        return uncovered
+
+    def _initial_rows(self) -> List[list]:
+        rows = list()
+        columns = tuple(range(self._strength))
+        for values in product(*[range(self._sizes[c]) for c in columns]):
+            row = list(values) + [None] * (self._n - self._strength)
+            if self._is_consistent(row, columns):
+                rows.append(row)
+        return rows
+
+    @staticmethod
+    def _column_sets(uncovered) -> List[Tuple[Callable, Set[Tuple[int]]]]:
+        """getter of the combination of each column set from a row, and the uncovered combinations of the set"""
+        sets = list()
+        for columns, combs in uncovered.items():
+            if len(columns) == 1:
+                sets.append((lambda row, c=columns[0]: (row[c],), combs))
+            else:
+                sets.append((itemgetter(*columns), combs))
+        return sets
+
+    @staticmethod
+    def _gain(row, sets) -> Tuple[int, int]:
+        """
+        number of uncovered combinations the row covers, and the number of combinations left in their column sets,
+        which prefers the column sets with most combinations left so that the vertical growth needs fewer rows
+        """
+        gain, weight = 0, 0
+        for get, combs in sets:
+            if get(row) in combs:
+                gain += 1
+                weight += len(combs)
+        return gain, weight
+
+    @staticmethod
+    def _mark_covered(row, sets):
+        """remove all combinations covered by the row, in every column set"""
+        for get, combs in sets:
+            combs.discard(get(row))
+
+    def _horizontal_growth(self, rows, k, uncovered):
+        """
+        extend the rows with values of parameter k, as IPOG-F (Forbes et al.): the (row, value) pair covering most
+        uncovered combinations is assigned first, ties are broken by the weight of the gain, then by the value used
+        by the fewest rows so far
+        the keys only get worse, so they are kept in a heap and recomputed when they reach the top
+        """
+        used = [0] * self._sizes[k]
+        sets = self._column_sets(uncovered)
+
+        def key_of(i, v):
+            gain, weight = self._gain(rows[i], sets)
+            return -gain, -weight, used[v], i, v
+
+        heap = list()
+        for i, row in enumerate(rows):
+            for v in range(self._sizes[k]):
+                row[k] = v
+                if self._is_consistent(row, (k,)):
+                    heap.append(key_of(i, v))
+            row[k] = None
+        heapq.heapify(heap)
+        while len(heap) > 0:
+            key = heapq.heappop(heap)
+            i, v = key[3], key[4]
+            row = rows[i]
+            if row[k] is not None:
+                continue
+            row[k] = v
+            current = key_of(i, v)
+            if current != key and len(heap) > 0 and current > heap[0]:
+                row[k] = None
+                heapq.heappush(heap, current)
+                continue
+            used[v] += 1
+            self._fill_for_gain(row, k, sets)
+            self._mark_covered(row, sets)
+
+    def _fill_for_gain(self, row, k, sets):
+        """assign the don't care values before parameter k which make the row cover more combinations"""
+        for j in range(k):
+            if row[j] is not None:
+                continue
+            best_value, best_gain = None, self._gain(row, sets)
+            for w in range(self._sizes[j]):
+                row[j] = w
+                if not self._is_consistent(row, (j,)):
+                    continue
+                gain = self._gain(row, sets)
+                if gain > best_gain:
+                    best_value, best_gain = w, gain
+            row[j] = best_value
+
+    def _vertical_growth(self, rows, k, uncovered):
+        """
+        cover the remaining combinations by assigning the don't care values of the existing rows, or by new rows,
+        the combinations a changed row newly covers in the other column sets are removed as well
+        """
+        sets = self._column_sets(uncovered)
+        for columns, combs in uncovered.items():
+            for values in sorted(combs):
+                if values not in combs:
+                    continue
+                placed = None
+                for row in rows:
+                    if any(row[c] is not None and row[c] != v for c, v in zip(columns, values)):
+                        continue
+                    backup = [row[c] for c in columns]
+                    for c, v in zip(columns, values):
+                        row[c] = v
+                    if self._is_consistent(row, columns):
+                        placed = row
+                        break
+                    for c, v in zip(columns, backup):
+                        row[c] = v
+                if placed is None:
+                    placed = [None] * self._n
+                    for c, v in zip(columns, values):
+                        placed[c] = v
+                    rows.append(placed)
+                self._mark_covered(placed, sets)
+
+    def _fill_dont_cares(self, rows) -> List[List[int]]:
+        result = list()
+        for row in rows:
+            row = self._complete(row)
+            if row is None:
+                continue
+            result.append([v if v is not None else random.randrange(self._sizes[p]) for p, v in enumerate(row)])
+        return result
+
+    def generate(self) -> List[List[int]]:
+        if self._n == 0 or self._strength == 0:
+            return [[]]
+        if any(s == 0 for s in self._sizes):
+            raise ValueError("domain of a parameter can not be empty")
+
+        rows = self._initial_rows()
+        for k in range(self._strength, self._n):
+            uncovered = self._uncovered_with(k)
+            self._horizontal_growth(rows, k, uncovered)
+            self._vertical_growth(rows, k, uncovered)
+        return self._fill_dont_cares(rows)
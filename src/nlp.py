@@ -1,45 +1,86 @@
+import hashlib
 import json
 import os
 import re
 from collections import defaultdict, Counter
 from enum import Enum
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Set
-
-import spacy
-from spacy.matcher import Matcher
-from spacy.tokens import Doc
+from typing import List, Set, Iterable, Dict, Optional, TYPE_CHECKING
 
 from src.factor import EnumFactor, AbstractFactor
 
-Doc.set_extension("constraints", default=None, force=True)
+if TYPE_CHECKING:
+    from spacy.language import Language
+    from spacy.matcher import Matcher
+    from spacy.tokens import Doc
+
+# spacy takes seconds to import, it is only imported when a pipeline is loaded
+SPACY_MODEL = "en_core_web_sm"
+# the patterns need lemmas (tagger, attribute_ruler and lemmatizer), the entities are set by the entity ruler
+UNUSED_PIPES = ["parser", "ner"]
+
+
+@lru_cache(maxsize=None)
+def loadPipeline(model: str) -> "Language":
+    """the base pipeline is loaded once per process and shared by all processors, it must not be modified"""
+    import spacy
+    from spacy.tokens import Doc
+
+    Doc.set_extension("constraints", default=None, force=True)
+    return spacy.load(model)
+
+
+@lru_cache(maxsize=None)
+def loadTokenizer(model: str) -> "Language":
+    """a pipeline which only tokenizes, sharing the vocab and the tokenizer of the base pipeline"""
+    import spacy
+
+    nlp = loadPipeline(model)
+    tokenizer = spacy.blank(nlp.lang, vocab=nlp.vocab)
+    tokenizer.tokenizer = nlp.tokenizer
+    return tokenizer
+
+
+def pipeTexts(nlp: "Language", texts: List[str], batchSize: int, nProcess: int = 1) -> Iterable["Doc"]:
+    """batched nlp.pipe, extra processes are only started if there are more texts than one batch"""
+    nProcess = nProcess if len(texts) > batchSize else 1
+    return nlp.pipe(texts, batch_size=batchSize, n_process=nProcess, disable=UNUSED_PIPES)
 
 
-@spacy.Language.factory("constraintMatcher")
-def createConstraintMatcher(nlp, name):
-    return ConstraintMatcher(nlp)
+@lru_cache(maxsize=None)
+def loadPatterns(patternFile: str) -> dict:
+    with Path(patternFile).open("r") as fp:
+        return json.load(fp)
+
+
+def compileMatcher(vocab, patterns: dict) -> "Matcher":
+    from spacy.matcher import Matcher
+
+    matcher = Matcher(vocab)
+    rules = defaultdict(list)
+    for ruleList in patterns.values():
+        for ruleInfo in ruleList:
+            constraint = tuple(ruleInfo.get("constraint"))
+            rules[constraint].append(ruleInfo.get("pattern"))
+    for constraint, patterns in rules.items():
+        matcher.add(repr(constraint), patterns)
+    return matcher
+
+
+@lru_cache(maxsize=None)
+def loadMatcher(patternFile: str, model: str) -> "Matcher":
+    """the constraint patterns are compiled once, matchers are stateless and can be shared"""
+    return compileMatcher(loadPipeline(model).vocab, loadPatterns(patternFile))
 
 
 class ConstraintMatcher:
-    def __init__(self, nlp):
+    def __init__(self, nlp, matcher: "Matcher"):
         self.nlp = nlp
-        self.matcher = Matcher(nlp.vocab)
-        self._loadPatterns()
+        self.matcher = matcher
 
         self.spanWithConstraints = set()
 
-    def _loadPatterns(self):
-        patternFile = Path(os.getenv("patternFile"))
-        with patternFile.open("r") as fp:
-            patterns = json.load(fp)
-        rules = defaultdict(list)
-        for ruleList in patterns.values():
-            for ruleInfo in ruleList:
-                constraint = tuple(ruleInfo.get("constraint"))
-                rules[constraint].append(ruleInfo.get("pattern"))
-        for constraint, patterns in rules.items():
-            self.matcher.add(repr(constraint), patterns)
-
     def __call__(self, doc):
         matches = self.matcher(doc)
         for matchId, start, end in matches:
@@ -61,8 +102,10 @@ class EntityLabel(Enum):
 
 
 class Processor:
-    def __init__(self, paramEntities: List[AbstractFactor]):
-        self.nlp = spacy.load("en_core_web_sm")
+    def __init__(self, paramEntities: List[AbstractFactor], batchSize: int = 64, nProcess: int = 1):
+        self.nlp = loadPipeline(SPACY_MODEL)
+        self._batchSize = batchSize
+        self._nProcess = nProcess
         self._paramEntities: List = paramEntities
         self._descriptions = [factor.description for factor in paramEntities]
         assert len({factor.get_global_name for factor in paramEntities}) == len(paramEntities)
@@ -73,16 +116,24 @@ class Processor:
         self.setNLP()
 
     def setNLP(self):
+        from spacy.pipeline import EntityRuler
+
         patterns = [{"label": EntityLabel.Param.value, "pattern": name, "id": name} for name in
                     self._paramNames.keys()]
         for valueSet in self._paramValues.values():
             for value in valueSet:
                 patterns.append({"label": EntityLabel.Value.value, "pattern": str(value), "id": str(value)})
 
-        rulerPipe = self.nlp.add_pipe("entity_ruler", config={"overwrite_ents": True})
-        with self.nlp.select_pipes(disable=self.nlp.pipe_names, ):
-            rulerPipe.add_patterns(patterns)
-        self.nlp.add_pipe("constraintMatcher", last=True)
+        # the entity ruler and the constraint matcher of an operation are applied after the shared pipeline,
+        # the patterns of the ruler only need to be tokenized
+        self._ruler = EntityRuler(loadTokenizer(SPACY_MODEL), overwrite_ents=True)
+        self._ruler.add_patterns(patterns)
+        self._matcher = ConstraintMatcher(self.nlp, loadMatcher(os.getenv("patternFile"), SPACY_MODEL))
+
+    @property
+    def texts(self) -> List[str]:
+        """the cleaned descriptions of the parameters, to be processed by the shared pipeline"""
+        return [self._cleanText(text) for text in self._descriptions]
 
     def _cleanText(self, text):
         if text is None:
@@ -91,11 +142,14 @@ class Processor:
                          token.text not in {"'", '"', "[", "]", "(", ")"} and not token.is_space])
 
     def parse(self):
+        return self.parseDocs(pipeTexts(self.nlp, self.texts, self._batchSize, self._nProcess))
+
+    def parseDocs(self, docs: Iterable["Doc"]):
+        """extract constraints from the docs of the texts, which have been processed by the shared pipeline"""
         constraints: List[Constraint] = list()
 
-        for text in self._descriptions:
-            text = self._cleanText(text)
-            doc = self.nlp(text)
+        for doc in docs:
+            doc = self._matcher(self._ruler(doc))
             involvedParamNames: Set[str] = set()
             involvedValues: Set[str] = set()
             involvedParamNames.update([ent.ent_id_ for ent in doc.ents if ent.label_ == EntityLabel.Param.value])
@@ -107,35 +161,47 @@ class Processor:
         return constraints
 
     def updateParam(self, constraints):
-        paramNames = set()
-        for c in constraints:
-            paramNames.update(c.paramNames)
-        for factor in self._paramEntities:
-            if factor.get_global_name in paramNames:
-                factor.is_constraint = True
-            else:
-                factor.is_constraint = False
+        markConstraintParams(self._paramEntities, constraints)
 
     def analyseError(self, errorResponses):
+        # only the parameter entities are needed, the messages are tokenized and passed to the entity ruler
+        messages = [self._cleanMessage(message) for message in errorResponses]
+        docs = pipeTexts(loadTokenizer(SPACY_MODEL), messages, self._batchSize, self._nProcess)
         unresolvedParams = list()
-        for message in errorResponses:
-            unresolvedParams.extend(self._analyseResponse(message))
+        for doc in docs:
+            unresolvedParams.extend(self._analyseResponse(self._ruler(doc)))
         sortedList = sorted(Counter(unresolvedParams).items(), key=lambda item: item[1], reverse=True)
         return [p for p, _ in sortedList]
 
-    def _analyseResponse(self, message):
-        records = set()
+    @staticmethod
+    def _cleanMessage(message):
         message = re.sub(r'["#$%&\'()*+,:;<=>?@^|{}~\s\n]+', " ", str(message))
         message = re.sub(
             r'[\001\002\003\004\005\006\007\x08\x09\x0a\x0b\x0c\x0d\x0e\x0f\x10\x11\x12\x13\x14\x15\x16\x17\x18\x19\x1a]+',
             " ", message
         )
-        doc = self.nlp(message)
+        return message
+
+    @staticmethod
+    def _analyseResponse(doc):
+        records = set()
         for ent in doc.ents:
             if ent.label_ == EntityLabel.Param.value:
                 records.add(ent.ent_id_)
         return records
 
+
+def markConstraintParams(factors: List[AbstractFactor], constraints):
+    paramNames = set()
+    for c in constraints:
+        paramNames.update(c.paramNames)
+    for factor in factors:
+        if factor.get_global_name in paramNames:
+            factor.is_constraint = True
+        else:
+            factor.is_constraint = False
+
+
 class Constraint:
     def __init__(self, template, paramNames, values, ents):
         self._template = template
@@ -143,6 +209,14 @@ class Constraint:
         self.valueStr = values
         self.ents = ents  # in order
 
+    def toDict(self) -> dict:
+        return {"template": self._template, "paramNames": sorted(self.paramNames), "values": sorted(self.valueStr),
+                "ents": self.ents}
+
+    @staticmethod
+    def fromDict(info: dict):
+        return Constraint(info["template"], set(info["paramNames"]), set(info["values"]), list(info["ents"]))
+
     def toActs(self, operation, valueDict: dict):
         """
         :param valueDict: parameters' domains. key: paramName, value: domain
@@ -192,3 +266,61 @@ class Constraint:
                 return None
             formattedStr = re.sub(matcher.group(), "{} {} {}".format(f"[{paramName}]", op, valueIndex), formattedStr)
         return formattedStr
+
+
+class ConstraintStore:
+    """
+    constraints extracted ahead of time by src/precompile.py, keyed by operation id. the store is only used if
+    the specification and the pattern file are unchanged since it was written.
+    """
+    VERSION = 1
+
+    def __init__(self, specDigest: str, patternDigest: str, constraints: Dict[str, List[Constraint]] = None):
+        self.specDigest = specDigest
+        self.patternDigest = patternDigest
+        self.constraints: Dict[str, List[Constraint]] = constraints if constraints is not None else dict()
+
+    @staticmethod
+    def digest(path) -> str:
+        with Path(path).open("rb") as fp:
+            return hashlib.sha256(fp.read()).hexdigest()
+
+    @staticmethod
+    def pathOf(swagger) -> str:
+        """the store is written next to the specification"""
+        return Path(swagger).with_suffix(".constraints.json").as_posix()
+
+    @classmethod
+    def of(cls, swagger, patternFile):
+        return cls(cls.digest(swagger), cls.digest(patternFile))
+
+    def isCurrent(self, swagger, patternFile) -> bool:
+        return self.specDigest == self.digest(swagger) and self.patternDigest == self.digest(patternFile)
+
+    def save(self, path):
+        content = {
+            "version": self.VERSION,
+            "spec": self.specDigest,
+            "patterns": self.patternDigest,
+            "operations": {opId: [c.toDict() for c in constraints] for opId, constraints in self.constraints.items()}
+        }
+        tmp = Path(f"{path}.tmp")
+        with tmp.open("w") as fp:
+            json.dump(content, fp, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path) -> Optional["ConstraintStore"]:
+        path = Path(path)
+        if not path.is_file():
+            return None
+        try:
+            with path.open("r") as fp:
+                content = json.load(fp)
+            if content.get("version") != cls.VERSION:
+                return None
+            constraints = {opId: [Constraint.fromDict(c) for c in items] for opId, items in
+                           content["operations"].items()}
+            return cls(content["spec"], content["patterns"], constraints)
+        except (ValueError, KeyError, TypeError):
+            return None
@@ -0,0 +1,74 @@
+import argparse
+import os
+import sys
+import time
+from argparse import Namespace
+from itertools import islice
+from pathlib import Path
+
+from loguru import logger
+
+
+def parse_args(root_path) -> Namespace:
+    parser = argparse.ArgumentParser(description="extract the constraints of a specification ahead of testing")
+
+    parser.add_argument('--swagger',
+                        help='abs path of swagger file',
+                        type=str, required=True)
+    parser.add_argument('--patterns',
+                        help='constraint patterns for nlp processes',
+                        type=str, required=False, default=f"{root_path}/lib/matchrules.json")
+    parser.add_argument('--output',
+                        help='constraint store, default=<swagger file>.constraints.json',
+                        type=str, required=False, default="")
+    parser.add_argument('--batch_size',
+                        help='number of descriptions processed by spacy in one batch, default=256',
+                        type=int, required=False, default=256)
+    parser.add_argument('--n_process',
+                        help='number of processes used by spacy, -1 for all cpus, default=1',
+                        type=int, required=False, default=1)
+
+    return parser.parse_args()
+
+
+def precompile(swagger, patterns, output, batch_size=256, n_process=1):
+    from src.config import Config
+    from src.nlp import Processor, ConstraintStore, loadPipeline, pipeTexts, SPACY_MODEL
+    from src.swagger import SwaggerParser
+
+    if not Path(swagger).exists():
+        raise Exception("swagger json does not exist")
+    if not Path(patterns).is_file():
+        raise Exception("patterns are not provided")
+    os.environ["patternFile"] = Path(patterns).as_posix()
+    if output is None or output == "":
+        output = ConstraintStore.pathOf(swagger)
+
+    config = Config()
+    config.swagger = swagger
+    operations = SwaggerParser(config).extract()
+
+    start = time.time()
+    processors = [Processor(op.get_leaf_factors(), batch_size, n_process) for op in operations]
+    texts = [p.texts for p in processors]
+    # the descriptions of all operations go through the shared pipeline in batches
+    docs = iter(pipeTexts(loadPipeline(SPACY_MODEL), [t for group in texts for t in group], batch_size, n_process))
+
+    store = ConstraintStore.of(swagger, patterns)
+    for op, processor, group in zip(operations, processors, texts):
+        store.constraints[op.id] = processor.parseDocs(islice(docs, len(group)))
+    store.save(output)
+
+    logger.info(f"operations: {len(operations)}, descriptions: {sum(len(group) for group in texts)}, "
+                f"constraints: {sum(len(c) for c in store.constraints.values())}, "
+                f"time: {time.time() - start:.2f}s, saved to {output}")
+    return store
+
+
+if __name__ == "__main__":
+    cur_path = os.path.abspath(os.path.dirname(__file__))
+    root_path = os.path.split(cur_path)[0]
+    sys.path.append(root_path)
+
+    args = parse_args(root_path)
+    precompile(args.swagger, args.patterns, args.output, args.batch_size, args.n_process)
@@ -1,6 +1,6 @@
 import abc
 from enum import Enum
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Iterable, Dict
 from urllib.parse import quote
 
 from src.factor import AbstractFactor, ArrayFactor
@@ -152,6 +152,10 @@ class RestPath:
         self.computed_to_string = "/" + "/".join(
             ["".join([str(t).replace("[\\[\\],]", "") for t in e.tokens]) for e in self.elements])
 
+        # set by PathIndex, the trie node of the path
+        self._index: Optional[PathIndex] = None
+        self._node: int = -1
+
     def resolve(self, param: List[RestParam]):
         path = self.resolve_path_param(param)
         query = self.resolve_query_param(param)
@@ -210,11 +214,15 @@ class RestPath:
         return [get_query_string(q) for q in usable_query_params]
 
     def is_ancestor_of(self, other):
+        if self._index is not None and self._index is other._index:
+            return self._index.is_ancestor(self._node, other._node)
         if len(self.elements) > len(other.elements):
             return False
         return all([e == other.elements[i] for i, e in enumerate(self.elements)])
 
     def is_directly_parent_of(self, other):
+        if self._index is not None and self._index is other._index:
+            return self._index.is_parent(self._node, other._node)
         if len(self.elements) + 1 != len(other.elements):
             return False
         return all([e == other.elements[i] for i, e in enumerate(self.elements)])
@@ -229,6 +237,55 @@ class RestPath:
         return self.computed_to_string == other.computed_to_string
 
 
+class PathIndex:
+    """
+    trie over the elements of the paths in a specification, the ancestor relations between its nodes are
+    computed once so that RestPath.is_ancestor_of and is_directly_parent_of become lookups
+    """
+
+    def __init__(self, paths: Iterable[RestPath]):
+        # node 0 is the root "/"
+        self._children: List[Dict[str, int]] = [dict()]
+        self._parents: List[int] = [-1]
+
+        paths = list(paths)
+        for path in paths:
+            node = 0
+            for e in path.elements:
+                key = str(e)
+                child = self._children[node].get(key)
+                if child is None:
+                    child = len(self._children)
+                    self._children.append(dict())
+                    self._parents.append(node)
+                    self._children[node][key] = child
+                node = child
+            path._index = self
+            path._node = node
+
+        # _ancestors[a][b]: node a is an ancestor of node b or b itself
+        size = len(self._children)
+        self._ancestors: List[List[bool]] = [[False] * size for _ in range(size)]
+        for node in range(size):
+            ancestor = node
+            while ancestor >= 0:
+                self._ancestors[ancestor][node] = True
+                ancestor = self._parents[ancestor]
+
+    def __len__(self):
+        return len(self._children)
+
+    def is_ancestor(self, node: int, other: int) -> bool:
+        return self._ancestors[node][other]
+
+    def is_parent(self, node: int, other: int) -> bool:
+        return self._parents[other] == node
+
+    @staticmethod
+    def index(operations: Iterable["RestOp"]) -> "PathIndex":
+        return PathIndex(op.path for op in operations)
+
+
 class RestOp:
     def __init__(self, host: str, path: str, verb: str):
         self._host = host
@@ -246,16 +303,31 @@ class RestOp:
         self.analysed = False
         self.is_re_handle = False
 
+        # leaf factors of the parameters and their index by global name, built on first use
+        self._leaves: Optional[List[AbstractFactor]] = None
+        self._leaf_index: Optional[Dict[str, AbstractFactor]] = None
+
     def resolved_url(self, chain=None) -> str:
         path = self.path.resolve_path_param(self.parameters, chain)
         return f"{self._host.strip('/')}/{path.strip('/')}"
 
-    def get_leaf_factors(self) -> list[AbstractFactor]:
-        leaves = []
-        for p in self.parameters:
-            leaves.extend(p.factor.get_leaves())
+    def add_parameter(self, param: RestParam):
+        self.parameters.append(param)
+        self._leaves = None
+        self._leaf_index = None
 
-        return leaves
+    def get_leaf_factors(self) -> list[AbstractFactor]:
+        if self._leaves is None:
+            leaves = []
+            for p in self.parameters:
+                leaves.extend(p.factor.get_leaves())
+            self._leaves = leaves
+        return self._leaves
+
+    def get_leaf(self, global_name: str) -> Optional[AbstractFactor]:
+        if self._leaf_index is None:
+            self._leaf_index = {f.get_global_name: f for f in self.get_leaf_factors()}
+        return self._leaf_index.get(global_name)
 
     def set_constraints(self, constraints: List[Constraint]):
         self.constraints = constraints
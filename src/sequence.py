@@ -1,7 +1,10 @@
+import threading
+from contextlib import contextmanager
 from itertools import permutations, combinations
 from random import choice
-from typing import List, Set
+from typing import List, Set, Iterable, Dict, Tuple, Iterator, Optional
 
+import numpy as np
 from loguru import logger
 
 from src.keywords import Method
@@ -42,21 +45,85 @@ class SemanticValidator:
 class SCA:
     def __init__(self, strength, operations):
         self._strength = min(strength, len(operations))
-        self._operations: Set[RestOp] = operations
+        self._operations: List[RestOp] = list(operations)
         # self._stat = stat
 
-        self._uncovered = self._compute_all_combinations()
+        # operations are interned to their indexes, and a permutation of operations is
+        # encoded as an integer in base len(operations)
+        self._op_index = {op: i for i, op in enumerate(self._operations)}
+        self._base = max(len(self._operations), 1)
+
+        # sorted codes of all valid permutations, a permutation is uncovered while its flag is alive
+        self._codes: np.ndarray = self._compute_all_combinations()
+        self._alive = np.ones(self._codes.size, dtype=bool)
+        self._remaining = int(self._codes.size)
         # self._stat.t_way_to_covered = len(self._uncovered)
 
+        # _next_counts[k][prefix] = (ops, counts): for the uncovered permutations starting with the k-size prefix,
+        # the sorted indexes of their (k + 1)-th operations and how many permutations continue with each of them
+        self._next_counts: List[Dict[int, Tuple[np.ndarray, np.ndarray]]] = self._build_next_counts()
+        # _scores[k][op]: the number of uncovered permutations p + (op,), where p is a k-size combination of
+        # the sequence under construction, kept up to date as the sequence grows
+        self._scores: List[np.ndarray] = list()
+
+    @property
+    def _uncovered(self) -> np.ndarray:
+        return self._codes[self._alive]
+
+    def _encode(self, indexes: Iterable[int]) -> int:
+        code = 0
+        for i in indexes:
+            code = code * self._base + i
+        return code
+
     def _compute_all_combinations(self):
-        cover = set()
-        for p in permutations(self._operations, self._strength):
-            if SemanticValidator.is_valid(p):
-                cover.add(p)
-        return cover
+        cover = list()
+        if self._strength > 0:
+            for p in permutations(range(len(self._operations)), self._strength):
+                if SemanticValidator.is_valid([self._operations[i] for i in p]):
+                    cover.append(self._encode(p))
+        return np.array(sorted(cover), dtype=np.int64)
+
+    def _split(self, codes: np.ndarray, k: int):
+        """split codes of permutations into the codes of their k-size prefixes and their (k + 1)-th operations"""
+        prefixes = codes // (self._base ** (self._strength - k - 1))
+        return np.divmod(prefixes, self._base)
+
+    def _build_next_counts(self):
+        next_counts = list()
+        for k in range(self._strength):
+            heads, nexts = self._split(self._codes, k)
+            pairs, counts = np.unique(heads * self._base + nexts, return_counts=True)
+            heads, nexts = np.divmod(pairs, self._base)
+            bounds = np.flatnonzero(np.diff(heads)) + 1
+            starts = np.concatenate(([0], bounds)) if heads.size > 0 else bounds
+            next_counts.append({
+                int(heads[i]): (ops, c.astype(np.int64))
+                for i, ops, c in zip(starts, np.split(nexts, bounds), np.split(counts, bounds))
+            })
+        return next_counts
+
+    def _reset_scores(self):
+        self._scores = [np.zeros(len(self._operations), dtype=np.int64) for _ in range(self._strength)]
+        if self._strength > 0 and 0 in self._next_counts[0]:
+            ops, counts = self._next_counts[0][0]
+            self._scores[0][ops] += counts
+
+    def _append(self, seq: List[RestOp], op: RestOp):
+        """append op to seq, the new k-size combinations of seq are the (k - 1)-size ones followed by op"""
+        indexes = [self._op_index[o] for o in seq]
+        index = self._op_index[op]
+        for k in range(1, self._strength):
+            for p in combinations(indexes, k - 1):
+                entry = self._next_counts[k].get(self._encode(p + (index,)))
+                if entry is not None:
+                    ops, counts = entry
+                    self._scores[k][ops] += counts
+        seq.append(op)
 
     def build_one_sequence(self):
         seq: List[RestOp] = list()
+        self._reset_scores()
 
         is_loop = True
         while is_loop:
@@ -69,11 +136,12 @@ class SCA:
                 if candidates == 0:
                     continue
 
-                max_count, op_list = self._find_best(candidates, seq, c_size)
+                max_count, op_list = self._find_best(candidates, c_size)
                 if max_count > 0:
                     selected = choice(op_list)
                     op_list_to_add = self._retrieve_dependent_ops(selected, seq)
-                    seq.extend(op_list_to_add)
+                    for op in op_list_to_add:
+                        self._append(seq, op)
                     break
                 else:
                     if c_size == 0:
@@ -81,7 +149,7 @@ class SCA:
 
         self._update_uncovered(seq)
         logger.info(
-            "uncovered combinations: {}, sequence length: {}".format(len(self._uncovered), len(seq)))
+            "uncovered combinations: {}, sequence length: {}".format(self._remaining, len(seq)))
 
         # self._stat.seq_all_num += 1
         # self._stat.sum_len_of_all_seq += len(seq)
@@ -89,8 +157,22 @@ class SCA:
         return seq
 
     def _update_uncovered(self, sequence: List[RestOp]):
-        covered = set(combinations(sequence, self._strength))
-        self._uncovered -= covered
+        indexes = [self._op_index[op] for op in sequence]
+        covered = np.array([self._encode(c) for c in combinations(indexes, self._strength)], dtype=np.int64)
+        if covered.size == 0 or self._codes.size == 0:
+            return
+        positions = np.minimum(np.searchsorted(self._codes, covered), self._codes.size - 1)
+        positions = positions[(self._codes[positions] == covered) & self._alive[positions]]
+        self._alive[positions] = False
+        self._remaining -= positions.size
+
+        # only the counters of the newly covered permutations are touched
+        newly = self._codes[positions]
+        for k in range(self._strength):
+            heads, nexts = self._split(newly, k)
+            for head, nxt in zip(heads.tolist(), nexts.tolist()):
+                ops, counts = self._next_counts[k][head]
+                counts[np.searchsorted(ops, nxt)] -= 1
         # self._stat.t_way_covered.update(covered)
 
     def _retrieve_dependent_ops(self, op: RestOp, seq: List[RestOp]):
@@ -121,35 +203,174 @@ class SCA:
 
         return candidates
 
-    def _find_best(self, candidates, seq, c_size):
+    def _find_best(self, candidates, c_size):
         if len(candidates) == 0:
             return 0, []
 
-        results = list()
-        max_count = 0
-        for c in candidates:
-            count = self._count_permutation_with_op(c, seq, c_size)
-            if count == max_count:
-                results.append(c)
-            elif count > max_count:
-                results.clear()
-                results.append(c)
-                max_count = count
-            else:
-                continue
+        counts = self._scores[c_size]
+        candidate_indexes = np.array(sorted(self._op_index[c] for c in candidates), dtype=np.int64)
+        candidate_counts = counts[candidate_indexes]
+        max_count = int(candidate_counts.max())
+        results = [self._operations[i] for i in candidate_indexes[candidate_counts == max_count]]
         return max_count, results
 
-    def _count_permutation_with_op(self, op, seq, c_size):
-        p_list = {p + (op,) for p in combinations(seq, c_size)}
-        if c_size == self._strength - 1:
-            return len(self._uncovered & p_list)
-        else:
-            count = 0
-            for uc in self._uncovered:
-                if uc[:(c_size + 1)] in p_list:
-                    count += 1
-        return count
-
     def is_all_covered(self):
-        return len(self._uncovered) == 0
+        return self._remaining == 0
+
+    def sequences(self) -> Iterator[List[RestOp]]:
+        """build sequences until all the t-way combinations are covered"""
+        while not self.is_all_covered():
+            yield self.build_one_sequence()
+
+
+class SequencePipeline:
+    """
+    sequences are built by SCA in a background thread while the built ones are tested,
+    at most capacity sequences are kept waiting, and the shortest one of the first window sequences is tested first
+    with several workers, a sequence is only dispatched when it does not conflict with the sequences being tested:
+    they share no operation (the factors of an operation hold the values of one case), and no resource written by
+    one of them is the same as, or contains or is contained by, a resource used by the other
+    """
+
+    def __init__(self, sca: SCA, window: int = 16, capacity: int = 32, sequences: Iterable[List[RestOp]] = ()):
+        self._sca = sca
+        self._window = max(window, 1)
+        self._capacity = max(capacity, self._window)
+        # built sequences in the order they are built
+        self._buffer: List[List[RestOp]] = list(sequences)
+        # sequences being tested and their footprints
+        self._running: List[List[RestOp]] = list()
+        self._footprints: List[Tuple[frozenset, Set[Tuple[str]], Set[Tuple[str]]]] = list()
+        # max number of sequences tested at the same time
+        self.peak = 0
+        self._condition = threading.Condition()
+        # held while SCA builds a sequence, so that a checkpoint sees SCA and the buffer consistent
+        self._sca_lock = threading.Lock()
+        self._finished = False
+        # SCA has covered all operations
+        self._exhausted = False
+        self._stopped = False
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._produce, name="sca", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _produce(self):
+        try:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: len(self._buffer) < self._capacity or self._stopped)
+                with self._sca_lock:
+                    if self._stopped:
+                        break
+                    if self._sca.is_all_covered():
+                        self._exhausted = True
+                        break
+                    sequence = self._sca.build_one_sequence()
+                    with self._condition:
+                        self._buffer.append(sequence)
+                        self._condition.notify_all()
+        except BaseException as e:
+            self._error = e
+        finally:
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
+
+    @staticmethod
+    def resource_of(op: RestOp) -> Tuple[str]:
+        """
+        segments of the collection an operation works on, path parameters are {},
+        e.g. (projects, {}, issues) of both /projects/{id}/issues and /projects/{id}/issues/{issue_id}
+        """
+        segments = tuple("{}" if "{" in e else e for e in op.path.__repr__().split("/") if e != "")
+        if len(segments) > 0 and segments[-1] == "{}":
+            segments = segments[:-1]
+        return segments
+
+    @classmethod
+    def footprint_of(cls, sequence: List[RestOp]) -> Tuple[frozenset, Set[Tuple[str]], Set[Tuple[str]]]:
+        """operations, written resources and used resources of a sequence"""
+        readonly = (Method.GET, Method.HEAD, Method.OPTIONS)
+        writes = {cls.resource_of(op) for op in sequence if op.verb not in readonly}
+        return frozenset(sequence), writes, {cls.resource_of(op) for op in sequence}
+
+    @staticmethod
+    def conflicts(footprint, other) -> bool:
+        if not footprint[0].isdisjoint(other[0]):
+            return True
+
+        def related(r1, r2):
+            # one resource is the other or contains it
+            return r1[:len(r2)] == r2[:len(r1)]
+
+        return any(related(w, r) for w in footprint[1] for r in other[2]) \
+            or any(related(w, r) for w in other[1] for r in footprint[2])
+
+    def _dispatchable(self) -> List[int]:
+        """indexes of the first window sequences in the buffer which do not conflict with the running ones"""
+        indexes = list()
+        for i, sequence in enumerate(self._buffer):
+            footprint = self.footprint_of(sequence)
+            if not any(self.conflicts(footprint, running) for running in self._footprints):
+                indexes.append(i)
+                if len(indexes) == self._window:
+                    break
+        return indexes
+
+    def acquire(self) -> Optional[List[RestOp]]:
+        """the next sequence to test, None if all sequences are tested or the pipeline is stopped"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._stopped or len(self._dispatchable()) > 0
+                                     or (self._finished and len(self._buffer) == 0))
+            if self._stopped:
+                return None
+            if len(self._buffer) == 0:
+                if self._error is not None:
+                    raise self._error
+                return None
+            indexes = self._dispatchable()
+            sequence = self._buffer.pop(min(indexes, key=lambda i: len(self._buffer[i])))
+            self._running.append(sequence)
+            self._footprints.append(self.footprint_of(sequence))
+            self.peak = max(self.peak, len(self._running))
+            self._condition.notify_all()
+            return sequence
+
+    @property
+    def done(self) -> bool:
+        """whether all sequences are built and tested"""
+        with self._condition:
+            return self._exhausted and len(self._buffer) == 0 and len(self._running) == 0
+
+    def release(self, sequence: List[RestOp]):
+        """the sequence is tested, the sequences conflicting with it can be dispatched"""
+        with self._condition:
+            index = next(i for i, s in enumerate(self._running) if s is sequence)
+            del self._running[index]
+            del self._footprints[index]
+            self._condition.notify_all()
+
+    @contextmanager
+    def paused(self):
+        """
+        stop building sequences in the block, and give the sequences which are not tested yet,
+        the sequences being tested are given first and tested again when the run is resumed
+        """
+        with self._sca_lock:
+            with self._condition:
+                pending = self._running + self._buffer
+            yield pending
+
+    def stop(self):
+        """stop building and dispatching sequences, the sequences being tested are not interrupted"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
 
+    def close(self):
+        self.stop()
+        if self._thread.is_alive():
+            self._thread.join()
@@ -1,8 +1,12 @@
+import hashlib
+import pickle
+import sys
+from importlib import metadata
+import pathlib
+from typing import Dict, List, Tuple
 from urllib.parse import urlparse, urlunparse
 
-import prance
 from loguru import logger
-from openapi_parser.parser import _create_parser
 from openapi_parser.specification import *
 
 from src.config import Config
@@ -15,8 +19,55 @@ def recursion_limit_handler(limit, parsed_url, recursions=()):
     return None
 
 
+# bump it whenever the classes of the operation model change, so that cached models are not loaded
+OPERATION_CACHE_VERSION = 4
+
+
+def _operation_cache_key(config: Config) -> str:
+    """the cache is invalidated by changes of the spec, the server, the format or the versions of the parsers"""
+    digest = hashlib.sha256()
+    with pathlib.Path(config.swagger).open("rb") as fp:
+        digest.update(fp.read())
+    versions = [str(OPERATION_CACHE_VERSION), sys.version, str(config.server)]
+    for package in ["prance", "openapi3-parser"]:
+        try:
+            versions.append(f"{package}={metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            versions.append(f"{package}=")
+    digest.update("|".join(versions).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_operations(config: Config) -> List[RestOp]:
+    """extract the operations of the spec, or load them from the cache in the output folder if the spec is unchanged"""
+    # openapi_parser.specification also defines a Path
+    cache_file = pathlib.Path(config.output_folder) / "cache" / f"operations_{_operation_cache_key(config)}.pkl"
+    if cache_file.is_file():
+        try:
+            with cache_file.open("rb") as fp:
+                operations = pickle.load(fp)
+            logger.debug(f"Operations loaded from {cache_file}")
+            return operations
+        except Exception as error:
+            logger.warning(f"Cannot load cached operations {cache_file}: {error}")
+
+    operations = SwaggerParser(config).extract()
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_suffix(".tmp")
+        with tmp.open("wb") as fp:
+            pickle.dump(operations, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp.replace(cache_file)
+    except (OSError, pickle.PicklingError, RecursionError) as error:
+        logger.warning(f"Cannot cache operations in {cache_file}: {error}")
+    return operations
+
+
 class SwaggerParser:
     def __init__(self, config: Config):
+        import prance
+        from openapi_parser.parser import _create_parser
+
         swagger_path = config.swagger
         server = config.server if config.server is not None else None
 
@@ -34,6 +85,7 @@ class SwaggerParser:
             raise ValueError(f"OpenAPI file parsing error: {error}")
 
         _parser = _create_parser(strict_enum=True)
+        self._share_schemas(_parser)
 
         # 解析swagger文件
         self._swagger: Specification = _parser.load_specification(specification)
@@ -41,6 +93,29 @@ class SwaggerParser:
         # 可能有多个server，只存一个
         self._server: str = self._get_server(server)
 
+        # factors of object and array schemas, keyed by the ids of the schemas
+        self._templates: Dict[int, Tuple[Schema, AbstractFactor]] = dict()
+
+    @staticmethod
+    def _share_schemas(parser):
+        """
+        prance resolves every use of a $ref to the same dict, so that the schema built from a dict is shared by all
+        its uses instead of being built again. the builders of the parser share one schema factory.
+        """
+        factory = parser.schemas_builder.schema_factory
+        create = factory.create
+        schemas: Dict[int, Tuple[dict, Schema]] = dict()
+
+        def create_shared(data: dict) -> Schema:
+            built = schemas.get(id(data))
+            if built is None:
+                # the dict is kept, so that its id is not reused
+                built = (data, create(data))
+                schemas[id(data)] = built
+            return built[1]
+
+        factory.create = create_shared
+
     def _get_server(self, specified):
         """
         get bash path of url
@@ -69,17 +144,17 @@ class SwaggerParser:
                 # handle with input parameters
                 for param in operation.parameters:
                     rest_param = self._extract_param(param)
-                    rest_op.parameters.append(rest_param)
+                    rest_op.add_parameter(rest_param)
 
                 if len(path_parameters) > 0:
                     for param in path_parameters:
                         rest_param = self._extract_param(param)
-                        rest_op.parameters.append(rest_param)
+                        rest_op.add_parameter(rest_param)
 
                 # handle request body
                 if operation.request_body is not None:
                     if not len(operation.request_body.content) == 0:
-                        rest_op.parameters.append(self._extract_body_param(operation.request_body))
+                        rest_op.add_parameter(self._extract_body_param(operation.request_body))
 
                 for r in operation.responses:
                     if r.code is None:
@@ -88,33 +163,32 @@ class SwaggerParser:
                     if r.content is not None:
                         for c in r.content:
                             content_type = c.type
-                            content = SwaggerParser._extract_factor("response", c.schema)
+                            content = self._extract_factor("response", c.schema)
                             response.add_content(content, content_type.name)
                     rest_op.responses.append(response)
                 operations.append(rest_op)
+        PathIndex.index(operations)
         return operations
 
-    @staticmethod
-    def _extract_body_param(body: RequestBody):
+    def _extract_body_param(self, body: RequestBody):
         content = body.content
         if len(content) == 0:
             raise ValueError("no content is provided")
 
         content = content[0]
 
-        factor: AbstractFactor = SwaggerParser._extract_factor("body", content.schema)
+        factor: AbstractFactor = self._extract_factor("body", content.schema)
         if body.description is not None and len(body.description) != 0:
             factor.set_description(body.description)
 
         return BodyParam(factor, content.type.value)
 
-    @staticmethod
-    def _extract_param(param: Parameter):
+    def _extract_param(self, param: Parameter):
         """
         extract factor from swagger
         """
         # factor info: AbstractFactor
-        factor: AbstractFactor = SwaggerParser._extract_factor(param.name, param.schema)
+        factor: AbstractFactor = self._extract_factor(param.name, param.schema)
         factor.required = param.required
         factor.set_description(param.description if param.description is not None else None)
         if param.location is ParameterLocation.QUERY:
@@ -127,8 +201,20 @@ class SwaggerParser:
             raise ValueError(f"Unsupported factor location: {param.location}")
         return rest_param
 
-    @staticmethod
-    def _extract_factor(name: str, schema: Schema):
+    def _extract_factor(self, name: str, schema: Schema):
+        """
+        object and array schemas are often shared (e.g. the same $ref used by many operations), their factors
+        are built once per schema and cloned for each use
+        """
+        if not isinstance(schema, (Object, Array)):
+            return self._build_factor(name, schema)
+        template = self._templates.get(id(schema))
+        if template is None:
+            template = (schema, self._build_factor(name, schema))
+            self._templates[id(schema)] = template
+        return template[1].clone(name)
+
+    def _build_factor(self, name: str, schema: Schema):
         if isinstance(schema, Null):
             raise ValueError(f"Parameter {name} has no schema")
         if len(schema.enum) > 0:
@@ -142,16 +228,16 @@ class SwaggerParser:
         elif isinstance(schema, String):
             factor = SwaggerParser._build_string_factor(name, schema)
         elif isinstance(schema, Array):
-            factor = SwaggerParser._build_array_factor(name, schema)
+            factor = self._build_array_factor(name, schema)
         elif isinstance(schema, Object):
-            factor = SwaggerParser._build_object_factor(name, schema)
+            factor = self._build_object_factor(name, schema)
         elif isinstance(schema, (AnyOf, OneOf)):
             _schema = next(filter(lambda x: x.type is DataType.Object, schema.schemas), None)
             if _schema is None:
                 _schema = next(filter(lambda x: x.type is DataType.Array, schema.schemas), None)
             if _schema is None:
                 _schema = schema.schemas[0]
-            factor = SwaggerParser._extract_factor(name, _schema)
+            factor = self._extract_factor(name, _schema)
         else:
             raise ValueError(f"{name} -> Unsupported schema: {schema}")
 
@@ -165,28 +251,26 @@ class SwaggerParser:
 
         return factor
 
-    @staticmethod
-    def _build_object_factor(name: str, schema: Object):
+    def _build_object_factor(self, name: str, schema: Object):
         object_factor = ObjectFactor(name)
 
         if len(schema.required) == 0:
             schema.required = [_.name for _ in schema.properties]
 
         for p in schema.properties:
-            p_factor = SwaggerParser._extract_factor(p.name, p.schema)
+            p_factor = self._extract_factor(p.name, p.schema)
             if p_factor.name not in schema.required:
                 p_factor.required = False
             object_factor.add_property(p_factor)
 
         return object_factor
 
-    @staticmethod
-    def _build_array_factor(name: str, schema: Array):
+    def _build_array_factor(self, name: str, schema: Array):
         min_items = schema.min_items if schema.min_items is not None else 1
         array = ArrayFactor(name)
         if schema.items is None:
             raise ValueError(f"Parameter {name} has no items")
-        item_factor = SwaggerParser._extract_factor("_item", schema.items)
+        item_factor = self._extract_factor("_item", schema.items)
         array.set_item(item_factor)
         return array
 
@@ -0,0 +1,107 @@
+import gzip
+import json
+import queue
+import threading
+from pathlib import Path
+
+from loguru import logger
+
+# suffixes of the compressed files
+COMPRESS_SUFFIX = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+
+class JsonLinesWriter:
+    """
+    append-only json lines file, records are written once by a background thread,
+    and flushed to the file at least every flush_interval seconds
+    each run appends a new gzip member or zstd frame to a compressed file, which are read as one stream
+    """
+
+    def __init__(self, path, compress: str = "none", flush_interval: float = 1.0):
+        if compress not in COMPRESS_SUFFIX:
+            raise ValueError(f"unknown compression: {compress}")
+        self.path = Path(str(path) + COMPRESS_SUFFIX[compress])
+        self._compress = compress
+        self._flush_interval = flush_interval
+        self._file = self._open()
+
+        self._records = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"writer-{self.path.name}", daemon=True)
+        self._thread.start()
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self._compress == "gzip":
+            return gzip.open(self.path, "at", encoding="utf-8")
+        if self._compress == "zstd":
+            import io
+            import zstandard
+
+            raw = self.path.open("ab")
+            return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(raw, closefd=True), encoding="utf-8")
+        return self.path.open("a", encoding="utf-8")
+
+    def write(self, record):
+        """the record is serialized by the background thread, so it must not be changed afterwards"""
+        self._records.put(record)
+
+    def _run(self):
+        stopped = False
+        while not stopped:
+            try:
+                records = [self._records.get(timeout=self._flush_interval)]
+            except queue.Empty:
+                records = []
+            while not self._records.empty():
+                records.append(self._records.get_nowait())
+            if None in records:
+                stopped = True
+                records = [r for r in records if r is not None]
+            try:
+                lines = list()
+                for r in records:
+                    try:
+                        lines.append(json.dumps(r, default=str) + "\n")
+                    except Exception as e:
+                        # e.g. RecursionError of a deeply nested response, only this record is dropped
+                        logger.warning(f"cannot serialize a record of {self.path}: {e!r}")
+                if len(lines) > 0:
+                    self._file.write("".join(lines))
+                    self._file.flush()
+            except Exception as e:
+                logger.warning(f"cannot write {len(records)} records to {self.path}: {e!r}")
+            finally:
+                # flush and close wait for all records taken from the queue
+                for _ in range(len(records) + (1 if stopped else 0)):
+                    self._records.task_done()
+
+    def flush(self):
+        """wait until the records received so far are written, or the thread is gone"""
+        with self._records.all_tasks_done:
+            while self._records.unfinished_tasks > 0 and self._thread.is_alive():
+                self._records.all_tasks_done.wait(self._flush_interval)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._records.put(None)
+            self._thread.join()
+        self._file.close()
+
+    @staticmethod
+    def read(path):
+        """records of a json lines file written by the writer, compressed or not"""
+        path = Path(path)
+        if path.suffix == ".gz":
+            fp = gzip.open(path, "rt", encoding="utf-8")
+        elif path.suffix == ".zst":
+            import io
+            import zstandard
+
+            reader = zstandard.ZstdDecompressor().stream_reader(path.open("rb"), read_across_frames=True)
+            fp = io.TextIOWrapper(reader, encoding="utf-8")
+        else:
+            fp = path.open("r", encoding="utf-8")
+        with fp:
+            for line in fp:
+                if line.strip() != "":
+                    yield json.loads(line)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the modules are imported as src.*, the same way as src/app.py does
+root_path = os.path.split(os.path.abspath(os.path.dirname(__file__)))[0]
+if root_path not in sys.path:
+    sys.path.append(root_path)
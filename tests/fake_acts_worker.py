@@ -0,0 +1,62 @@
+"""
+stand-in for lib/ActsWorker.java speaking the same protocol, used by test_generator.py
+usage: fake_acts_worker.py mode log, the requests are appended to the log and each start is logged as START
+modes:
+  ok: answer every request, the csv echoes the model
+  err: answer ERR to the first request and stop, as the worker does on jdk 18+
+  silent: stop without answering
+  crash: exit on the first REQ of the first start, answer the requests of the later starts
+  crash_always: exit on every REQ
+  hang: never answer REQ
+"""
+import sys
+import time
+
+mode, log = sys.argv[1], sys.argv[2]
+stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+
+
+def record(line):
+    with open(log, "a", encoding="utf-8") as fp:
+        fp.write(line + "\n")
+
+
+def send(line):
+    stdout.write((line + "\n").encode("utf-8"))
+    stdout.flush()
+
+
+with open(log, "a+", encoding="utf-8") as fp:
+    fp.seek(0)
+    starts = fp.read().splitlines().count("START") + 1
+record("START")
+
+if mode == "silent":
+    sys.exit(0)
+
+while True:
+    line = stdin.readline()
+    if not line:
+        break
+    line = line.rstrip(b"\r\n").decode("utf-8")
+    record(line)
+    if mode == "err":
+        send("ERR cannot trap System.exit of acts: java.lang.UnsupportedOperationException")
+        break
+    if line == "PING":
+        send("PONG")
+        continue
+    if line == "EXIT":
+        break
+    _, strength, length = line.split(" ")
+    model = stdin.read(int(length))
+    if mode == "crash_always" or (mode == "crash" and starts == 1):
+        sys.exit(1)
+    if mode == "hang":
+        time.sleep(60)
+    if model == b"bad":
+        send("ERR cannot parse the model")
+        continue
+    csv = f"# strength {strength}\r\n".encode("utf-8") + model
+    stdout.write(f"OK {len(csv)}\n".encode("utf-8") + csv)
+    stdout.flush()
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.algorithms import RestCT
+from src.checkpoint import Checkpoint
+from src.rest import RestOp
+
+HOST = "http://localhost:8888"
+
+
+@pytest.fixture
+def operations():
+    return [RestOp(HOST, "/users", "post"), RestOp(HOST, "/users/{id}", "get"), RestOp(HOST, "/users/{id}", "delete")]
+
+
+def checkpoint_of(operations, complete=False, elapsed=12.5):
+    post, get, delete = operations
+    return Checkpoint("key", elapsed, [[post, get], [post, delete]], {"sequences": [(post, get)]},
+                      {"_success_operations": {post}}, {"id_counter": [3]}, complete)
+
+
+def test_checkpoint_round_trips(tmp_path, operations):
+    path = tmp_path / "checkpoint.pkl"
+    checkpoint_of(operations).save(path)
+    assert not path.with_suffix(".tmp").exists()
+
+    # the operations are restored as the ones of the run, not as copies
+    copies = [RestOp(HOST, "/users", "post"), RestOp(HOST, "/users/{id}", "get"),
+              RestOp(HOST, "/users/{id}", "delete")]
+    checkpoint = Checkpoint.load(path, "key", copies)
+    post, get, delete = copies
+    assert checkpoint.elapsed == 12.5
+    assert not checkpoint.complete
+    assert all(a is b for a, b in zip(checkpoint.sequences[0] + checkpoint.sequences[1], [post, get, post, delete]))
+    assert checkpoint.sca["sequences"][0][1] is get
+    assert next(iter(checkpoint.manager["_success_operations"])) is post
+    assert checkpoint.ca == {"id_counter": [3]}
+
+
+def test_checkpoint_of_another_run_is_not_loaded(tmp_path, operations):
+    path = tmp_path / "checkpoint.pkl"
+    checkpoint_of(operations).save(path)
+    assert Checkpoint.load(path, "another key", operations) is None
+    # an operation which is not in the spec any more
+    assert Checkpoint.load(path, "key", operations[:2]) is None
+    assert Checkpoint.load(tmp_path / "missing.pkl", "key", operations) is None
+
+    path.write_bytes(path.read_bytes()[:20])
+    assert Checkpoint.load(path, "key", operations) is None
+
+
+def test_checkpoint_of_another_version_is_not_loaded(tmp_path, operations):
+    path = tmp_path / "checkpoint.pkl"
+    checkpoint = checkpoint_of(operations)
+    checkpoint.version = -1
+    checkpoint.save(path)
+    assert Checkpoint.load(path, "key", operations) is None
+
+
+def restct_of(tmp_path, operations, budget=100):
+    swagger = tmp_path / "swagger.json"
+    swagger.write_text("{}")
+    config = SimpleNamespace(data_path=tmp_path.as_posix(), swagger=swagger.as_posix(), s_strength=2, e_strength=2,
+                             a_strength=2, budget=budget)
+    restct = object.__new__(RestCT)
+    restct._config = config
+    restct._operations = operations
+    return restct
+
+
+@pytest.mark.parametrize("complete, elapsed, message", [
+    (True, 12.5, "has tested all sequences"),
+    (False, 100, "has used up the budget"),
+])
+def test_finished_checkpoint_is_not_resumed(tmp_path, operations, complete, elapsed, message):
+    restct = restct_of(tmp_path, operations)
+    checkpoint = checkpoint_of(operations, complete, elapsed)
+    checkpoint.key = Checkpoint.key_of(restct._config)
+    checkpoint.save(Checkpoint.path_of(restct._config))
+    with pytest.raises(Exception, match=message):
+        restct._resume()
+
+
+def test_missing_checkpoint_is_not_resumed(tmp_path, operations):
+    with pytest.raises(Exception, match="cannot resume"):
+        restct_of(tmp_path, operations)._resume()
@@ -0,0 +1,116 @@
+from itertools import combinations, product
+
+import numpy as np
+import pytest
+
+from src.covering import ABSENT, CoveringArray
+from src.factor import Value, ValueType
+
+
+def values(*vals, generator=ValueType.Example):
+    return [Value(v, generator) for v in vals]
+
+
+def rows_of(array):
+    return [dict((name, value.val) for name, value in case.items()) for case in array]
+
+
+@pytest.fixture
+def array():
+    domain_map = {"a": values(1, 2), "b": values("x", "y", "z"), "c": values(True, False)}
+    return CoveringArray.of(["a", "b", "c"], [[0, 0, 0], [1, 1, 0], [0, 2, 1], [1, 1, 0]], domain_map, [])
+
+
+def test_rows_are_decoded_into_cases(array):
+    assert len(array) == 4
+    assert rows_of(array) == [{"a": 1, "b": "x", "c": True}, {"a": 2, "b": "y", "c": True},
+                              {"a": 1, "b": "z", "c": False}, {"a": 2, "b": "y", "c": True}]
+    assert array[-1]["b"].val == "y"
+    with pytest.raises(IndexError):
+        array[4]
+    with pytest.raises(KeyError):
+        array[0]["d"]
+
+
+def test_absent_parameters_are_not_in_the_cases():
+    array = CoveringArray(["a", "b"], [values(1), values(2)], [[0, ABSENT], [ABSENT, 0]])
+    assert rows_of(array) == [{"a": 1}, {"b": 2}]
+    assert "b" not in array[0]
+    assert len(array[1]) == 1
+    with pytest.raises(KeyError):
+        array[0]["b"]
+
+
+def test_history_cases_are_expanded_into_columns():
+    history = [{"h1": Value("p")}, {"h1": Value("q"), "h2": Value("r")}]
+    domain_map = {"a": values(1, 2), "history_ca_of_current_op": values(0, 1)}
+    array = CoveringArray.of(["history_ca_of_current_op", "a"], [[0, 0], [1, 1]], domain_map, history)
+    assert array.names == ("a", "h1", "h2")
+    assert rows_of(array) == [{"a": 1, "h1": "p"}, {"a": 2, "h1": "q", "h2": "r"}]
+
+
+def test_unique_keeps_the_first_rows_in_order(array):
+    assert rows_of(array.unique()) == rows_of(array)[:3]
+
+
+def test_select_and_compact(array):
+    selected = array.select([0, 2])
+    assert rows_of(selected) == [rows_of(array)[0], rows_of(array)[2]]
+    assert selected.domain(1) is array.domain(1)
+    compact = selected.compact()
+    assert rows_of(compact) == rows_of(selected)
+    assert [v.val for v in compact.domain(1)] == ["x", "z"]
+    assert [v.val for v in compact.domain(0)] == [1]
+
+
+def test_used_values_are_in_the_order_of_appearance(array):
+    assert [v.val for v in array.used_values(1)] == ["x", "y", "z"]
+    assert [v.val for v in array.select([2, 1]).used_values(1)] == ["z", "y"]
+
+
+def test_concat_joins_the_columns_and_shares_equal_values():
+    shared = Value("s")
+    first = CoveringArray(["a", "b"], [[shared, Value("t")], values(1)], [[0, 0], [1, 0]])
+    second = CoveringArray(["b", "c"], [values(2), [shared]], [[0, 0]])
+    third = CoveringArray(["a"], [[shared]], [[0]])
+    joined = CoveringArray.concat([first, second, third])
+    assert joined.names == ("a", "b", "c")
+    assert rows_of(joined) == [{"a": "s", "b": 1}, {"a": "t", "b": 1}, {"b": 2, "c": "s"}, {"a": "s"}]
+    # the same value object has one index in a column
+    assert len(joined.domain(0)) == 2
+    assert rows_of(CoveringArray.concat([third, third]).unique()) == [{"a": "s"}]
+
+
+def test_with_generator_marks_the_values(array):
+    reused = array.with_generator(ValueType.Reused)
+    assert rows_of(reused) == rows_of(array)
+    assert all(v.generator is ValueType.Reused for column in range(3) for v in reused.domain(column))
+    assert all(v.generator is ValueType.Example for v in array.domain(0))
+
+
+def test_empty_array_has_empty_cases():
+    array = CoveringArray.empty(2)
+    assert len(array) == 2
+    assert rows_of(array) == [{}, {}]
+
+
+@pytest.mark.parametrize("strength", [1, 2, 3])
+def test_covered_combinations_are_counted(array, strength):
+    matrix = array.matrix.tolist()
+    covered = sum(len({tuple(row[c] for c in columns) for row in matrix})
+                  for columns in combinations(range(3), strength))
+    total = sum(int(np.prod([len(array.domain(c)) for c in columns])) for columns in combinations(range(3), strength))
+    assert array.count_covered(strength) == covered
+    assert array.count_combinations(strength) == total
+    assert array.is_covering(strength) is (covered == total)
+
+
+def test_full_array_is_covering():
+    domain_map = {"a": values(1, 2), "b": values(1, 2, 3)}
+    array = CoveringArray.of(["a", "b"], list(product(range(2), range(3))), domain_map, [])
+    assert array.is_covering(2)
+    assert array.count_covered(2) == 6
+    # absent parameters cover no combination
+    partial = CoveringArray(["a", "b"], [values(1), values(1)], [[0, ABSENT]])
+    assert partial.count_covered(2) == 0
+    assert partial.count_covered(1) == 1
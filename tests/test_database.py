@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.covering import CoveringArray
+from src.database import SqliteInfoManager
+from src.factor import Value, ValueType
+
+
+class Op:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+def config_of(path, resume=False):
+    return SimpleNamespace(data_path=path.as_posix(), compress=False, resume=resume)
+
+
+def array_of(name, values, rows):
+    return CoveringArray([name], [[Value(v, ValueType.Example) for v in values]], [[r] for r in rows])
+
+
+def count(manager, table):
+    return manager._connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+@pytest.fixture
+def ops():
+    return [Op("post*/users"), Op("get*/users/{id}")]
+
+
+def run(path, ops, resume=False):
+    manager = SqliteInfoManager(config_of(path, resume), ops, batch_size=2, commit_interval=3600)
+    manager.save_case_response(ops[0], {"name": "a"}, {"id": 1}, 201)
+    manager.save_success_seq(tuple(ops))
+    manager.save_reuse(tuple(ops), True, array_of("name", ["a", "b"], [0, 1]))
+    manager.save_ok_value(array_of("name", ["a", "b"], [0, 1]))
+    return manager
+
+
+def test_data_are_kept_in_the_database(tmp_path, ops):
+    manager = run(tmp_path, ops)
+    manager.close()
+
+    manager = SqliteInfoManager(config_of(tmp_path, resume=True), ops)
+    assert count(manager, "test_case") == 1
+    assert count(manager, "success_sequence") == 1
+    reused = manager.get_reused_with_essential_p(tuple(ops))
+    assert len(reused) == 2
+    assert all(v.generator is ValueType.Reused for v in reused.domain(0))
+    assert len(manager.get_reused_with_all_p(tuple(ops))) == 0
+    assert [v.val for v in manager._ok_values("name")] == ["a", "b"]
+    manager.close()
+
+
+def test_test_cases_are_committed_in_batches(tmp_path, ops):
+    manager = SqliteInfoManager(config_of(tmp_path), ops, batch_size=2, commit_interval=3600)
+    manager.save_case_response(ops[0], {}, {}, 200)
+    assert count(manager, "test_case") == 0
+    manager.save_case_response(ops[0], {}, {}, 500)
+    assert count(manager, "test_case") == 2
+    manager.save_case_response(ops[1], {}, {}, 404)
+    manager.flush()
+    assert count(manager, "test_case") == 3
+    manager.close()
+
+
+def test_ok_values_are_limited_and_unique(tmp_path, ops):
+    manager = SqliteInfoManager(config_of(tmp_path), ops)
+    manager.save_ok_value(array_of("name", range(8), range(8)))
+    manager.save_ok_value(array_of("name", range(8), range(8)))
+    manager.save_ok_value(array_of("name", range(20), range(8, 20)))
+    assert [v.val for v in manager._ok_values("name")] == list(range(10))
+    assert count(manager, "ok_value") == 10
+    manager.close()
+
+
+def test_a_new_run_starts_with_an_empty_database(tmp_path, ops):
+    run(tmp_path, ops).close()
+
+    manager = SqliteInfoManager(config_of(tmp_path), ops)
+    for table in ("test_case", "error_response", "reused_case", "ok_value", "success_sequence"):
+        assert count(manager, table) == 0
+    assert len(manager.get_reused_with_essential_p(tuple(ops))) == 0
+    assert manager._ok_values("name") == []
+    manager.close()
+
+
+def test_a_resumed_run_appends_to_the_database(tmp_path, ops):
+    run(tmp_path, ops).close()
+    run(tmp_path, ops, resume=True).close()
+
+    manager = SqliteInfoManager(config_of(tmp_path, resume=True), ops)
+    assert count(manager, "test_case") == 2
+    assert count(manager, "success_sequence") == 1
+    assert count(manager, "ok_value") == 2
+    manager.close()
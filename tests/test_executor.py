@@ -0,0 +1,75 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.executor import RestRequest
+from src.rest import Method
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    in_flight = 0
+    peak = 0
+
+    def do_GET(self):
+        with Handler.lock:
+            Handler.in_flight += 1
+            Handler.peak = max(Handler.peak, Handler.in_flight)
+        time.sleep(0.05)
+        with Handler.lock:
+            Handler.in_flight -= 1
+        body = json.dumps({"path": self.path}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Manager:
+    def __init__(self):
+        self.statistics = list()
+
+    def save_pool_statistics(self, statistics):
+        self.statistics.append(statistics)
+
+
+@pytest.fixture
+def server():
+    Handler.in_flight = Handler.peak = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_send_all_keeps_the_order_and_bounds_the_requests_in_flight(server):
+    manager = Manager()
+    executor = RestRequest({}, {}, manager, max_in_flight=3)
+    requests = [(Method.GET, f"{server}/r{i}", {}, {}) for i in range(12)]
+    responses = executor.send_all(requests)
+    executor.close()
+    assert responses == [(200, {"path": f"/r{i}"}) for i in range(12)]
+    assert 1 < Handler.peak <= 3
+
+
+def test_pool_statistics_are_saved_once_at_close(server):
+    manager = Manager()
+    executor = RestRequest({}, {}, manager, max_in_flight=2)
+    executor.send(Method.GET, f"{server}/a", {})
+    executor.send_all([(Method.GET, f"{server}/b", {}, {}), (Method.GET, f"{server}/c", {}, {})])
+    assert manager.statistics == []
+    executor.close()
+    assert len(manager.statistics) == 1
+    statistics = manager.statistics[0]
+    assert statistics["requests"] == 3
+    assert statistics["new_connections"] + statistics["reused"] == 3
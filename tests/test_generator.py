@@ -0,0 +1,100 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from src import generator
+from src.generator import ActsWorker
+
+FAKE_WORKER = Path(__file__).resolve().parent / "fake_acts_worker.py"
+
+
+@pytest.fixture
+def worker_of(tmp_path, monkeypatch):
+    """acts worker running the fake worker in the mode instead of the jvm, and the requests it received"""
+    popen = subprocess.Popen
+    log = tmp_path / "requests.log"
+    workers = list()
+
+    def of(mode, timeout=5):
+        monkeypatch.setattr(generator.subprocess, "Popen",
+                            lambda command, **kwargs: popen([sys.executable, str(FAKE_WORKER), mode, str(log)],
+                                                            **kwargs))
+        worker = ActsWorker("acts.jar", timeout)
+        workers.append(worker)
+        return worker, lambda: log.read_text(encoding="utf-8").splitlines() if log.exists() else []
+
+    yield of
+    for worker in workers:
+        worker.stop(force=True)
+
+
+def test_requests_are_framed_by_their_lengths_in_bytes(worker_of):
+    worker, requests = worker_of("ok")
+    worker.start()
+    model = "[System]\r\nName: 模型 😀\r\n[Parameter]\r\nP0 (int) : 0,1\r\n"
+    assert worker.generate(2, model) == ["# strength 2"] + model.splitlines()
+    assert worker.generate(3, "[System]\n") == ["# strength 3", "[System]"]
+    process = worker._process
+    worker.stop()
+    assert process.wait(5) == 0
+    assert requests() == ["START", "PING", f"REQ 2 {len(model.encode('utf-8'))}",
+                          "REQ 3 9", "EXIT"]
+
+
+def test_error_of_a_request_keeps_the_worker(worker_of):
+    worker, requests = worker_of("ok")
+    worker.start()
+    with pytest.raises(RuntimeError, match="acts worker error: cannot parse the model"):
+        worker.generate(2, "bad")
+    assert worker.is_alive()
+    assert worker.generate(2, "P") == ["# strength 2", "P"]
+    assert requests().count("START") == 1
+
+
+def test_worker_is_rejected_when_it_cannot_trap_exit(worker_of):
+    # the worker answers ERR to the first request on jdk 18+, where a SecurityManager cannot be installed
+    worker, requests = worker_of("err")
+    with pytest.raises(RuntimeError, match="acts worker cannot start: cannot trap System.exit"):
+        worker.start()
+    assert not worker.is_alive()
+    assert requests() == ["START", "PING"]
+
+
+def test_worker_is_rejected_when_it_does_not_respond(worker_of):
+    worker, _ = worker_of("silent")
+    with pytest.raises(RuntimeError, match="acts worker does not respond"):
+        worker.start()
+    assert not worker.is_alive()
+
+
+def test_worker_is_restarted_after_a_crash(worker_of):
+    worker, requests = worker_of("crash")
+    worker.start()
+    with pytest.raises(RuntimeError, match="acts worker crashed"):
+        worker.generate(2, "P")
+    assert not worker.is_alive()
+    assert worker.generate(2, "P") == ["# strength 2", "P"]
+    assert requests().count("START") == 2
+    assert worker._restarts == 1
+
+
+def test_worker_is_not_restarted_more_than_max_restarts(worker_of):
+    worker, requests = worker_of("crash_always")
+    worker.start()
+    for _ in range(ActsWorker.max_restarts + 1):
+        with pytest.raises(RuntimeError, match="acts worker crashed: "):
+            worker.generate(2, "P")
+    with pytest.raises(RuntimeError, match="acts worker crashed too many times"):
+        worker.generate(2, "P")
+    assert requests().count("START") == ActsWorker.max_restarts + 1
+
+
+def test_worker_is_killed_when_it_does_not_return_in_time(worker_of):
+    worker, requests = worker_of("hang", timeout=0.5)
+    worker.start()
+    with pytest.raises(TimeoutError):
+        worker.generate(2, "P")
+    assert not worker.is_alive()
+    assert requests()[-1] == "REQ 2 1"
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+from src.checkpoint import dumps, loads
+from src.info import ChainNode, ChainStore, RuntimeInfoManager
+from src.rest import RestOp
+
+HOST = "http://localhost:8888"
+
+
+def manager_of(path):
+    return RuntimeInfoManager(SimpleNamespace(data_path=path.as_posix(), compress=False))
+
+
+def test_chain_node_maps_operations_to_their_latest_responses():
+    post, get = RestOp(HOST, "/users", "post"), RestOp(HOST, "/users/{id}", "get")
+    chain = ChainNode().extend(post, {"id": 1}).extend(get, {"name": "a"}).extend(post, {"id": 2})
+    assert len(chain) == 2
+    assert list(chain) == [post, get]
+    assert chain[post] == {"id": 2}
+    assert RestOp(HOST, "/users", "delete") not in chain
+
+
+def test_hidden_responses_are_dropped_from_long_chains():
+    ops = [RestOp(HOST, f"/r{i}", "post") for i in range(5)]
+    chain = ChainNode()
+    for i in range(1000):
+        chain = chain.extend(ops[i % 5], {"i": i})
+    assert len(chain) == 5
+    assert list(chain) == ops
+    assert [chain[op] for op in ops] == [{"i": i} for i in range(995, 1000)]
+    assert chain._depth <= 10
+
+
+def test_long_chain_round_trips_through_pickle():
+    ops = [RestOp(HOST, f"/r{i}", "post") for i in range(1000)]
+    chain = ChainNode()
+    for i, op in enumerate(ops):
+        chain = chain.extend(op, {"i": i})
+    restored = loads(dumps(chain), {op.__repr__(): op for op in ops})
+    assert len(restored) == 1000
+    assert list(restored) == ops
+    assert restored[ops[-1]] == {"i": 999}
+
+
+def test_chain_store_drops_the_oldest_chain():
+    store = ChainStore(2)
+    op = RestOp(HOST, "/users", "post")
+    chains = [ChainNode().extend(op, {"id": i}) for i in range(3)]
+    assert store.add(chains[0]) is None
+    assert store.add(chains[1]) is None
+    assert store.add(chains[2]) is chains[0]
+    assert list(store) == chains[1:]
+
+
+def test_response_indexes_are_rebuilt_from_the_chains(tmp_path):
+    post, get = RestOp(HOST, "/users", "post"), RestOp(HOST, "/users/{id}", "get")
+    manager = manager_of(tmp_path)
+    chain = manager.get_chains(10)[0]
+    manager.save_chain(chain, post, {"id": 1, "profile": {"name": "a"}})
+    manager.save_chain(manager.get_chains(10)[0], get, [{"tags": ["x"]}])
+
+    state = manager.get_state()
+    assert "_response_indexes" not in state
+    restored = manager_of(tmp_path)
+    restored.set_state(loads(dumps(state), {op.__repr__(): op for op in (post, get)}))
+
+    responses = [r for c in restored.get_chains(10) for r in c.values()]
+    assert len(responses) == 3
+    assert len(restored._response_indexes) == 2
+    for response in responses:
+        index = restored._response_indexes[id(response)]
+        assert index.response is response
+        assert restored.response_index(response) is index
+    manager.close()
+    restored.close()
@@ -0,0 +1,73 @@
+from itertools import combinations, product
+
+import pytest
+
+from src.ipog import IPOG, ActsConstraint
+
+
+def uncovered(rows, sizes, strength, constraints=()):
+    """t-way combinations of the valid rows which are not covered by the rows"""
+    constraints = [ActsConstraint(c) for c in constraints]
+    valid = [r for r in product(*[range(s) for s in sizes]) if all(c.is_satisfied(list(r)) for c in constraints)] \
+        if len(constraints) > 0 else None
+    missing = set()
+    for columns in combinations(range(len(sizes)), strength):
+        covered = {tuple(r[c] for c in columns) for r in rows}
+        if valid is None:
+            required = set(product(*[range(sizes[c]) for c in columns]))
+        else:
+            required = {tuple(r[c] for c in columns) for r in valid}
+        missing.update((columns, comb) for comb in required - covered)
+    return missing
+
+
+@pytest.mark.parametrize("sizes, strength, max_rows", [
+    ([5] * 4, 2, 30),
+    ([3] * 13, 2, 19),
+    ([2] * 10, 2, 7),
+    ([5, 4, 3, 2, 2, 2], 2, 20),
+    ([3] * 10, 3, 62),
+])
+def test_small_covering_arrays(sizes, strength, max_rows):
+    rows = IPOG(sizes, strength, []).generate()
+    assert len(rows) <= max_rows
+    assert all(0 <= v < sizes[p] for row in rows for p, v in enumerate(row))
+    assert uncovered(rows, sizes, strength) == set()
+
+
+def test_many_parameters():
+    sizes = [4] * 30
+    rows = IPOG(sizes, 2, []).generate()
+    # the size of acts is about 30, the arrays used to have 87 rows
+    assert len(rows) <= 43
+    for columns in combinations(range(len(sizes)), 2):
+        assert len({tuple(r[c] for c in columns) for r in rows}) == 16
+
+
+def test_constraints_are_satisfied_and_valid_combinations_covered():
+    sizes = [3, 3, 3, 3, 2]
+    constraints = ["(P0 = 1) => (P1 != 2)", "P2 != P3", "(P4 = 1) => (P0 = 0)"]
+    rows = IPOG(sizes, 2, constraints).generate()
+    parsed = [ActsConstraint(c) for c in constraints]
+    assert all(c.is_satisfied(row) for row in rows for c in parsed)
+    assert uncovered(rows, sizes, 2, constraints) == set()
+
+
+def test_unsatisfiable_rows_are_dropped():
+    rows = IPOG([2, 2], 2, ["P0 != P1"]).generate()
+    assert sorted(map(tuple, rows)) == [(0, 1), (1, 0)]
+
+
+def test_no_parameters():
+    assert IPOG([], 2, []).generate() == [[]]
+
+
+@pytest.mark.parametrize("text, row, expected", [
+    ("P0 = 1", [1, None], True),
+    ("P0 = 1 && P1 = 0", [1, 1], False),
+    ("(P0 = 1 || P0 = 2) => (P1 != 2)", [2, 2], False),
+    ("!(P0 = P1)", [0, 0], False),
+    ("P1 > 0", [0, None], True),
+])
+def test_acts_constraint(text, row, expected):
+    assert ActsConstraint(text).is_satisfied(row) is expected
@@ -0,0 +1,174 @@
+import random
+import threading
+from itertools import combinations, permutations
+
+import pytest
+
+from src.rest import RestOp
+from src.sequence import SCA, SemanticValidator, SequencePipeline
+
+HOST = "http://localhost:8888"
+
+
+def operations_of(*specs):
+    return [RestOp(HOST, path, verb) for verb, path in (spec.split(" ") for spec in specs)]
+
+
+@pytest.fixture
+def operations():
+    return operations_of("post /users", "get /users", "get /users/{id}", "put /users/{id}", "delete /users/{id}",
+                         "post /users/{id}/posts", "get /users/{id}/posts/{pid}", "delete /users/{id}/posts/{pid}",
+                         "get /tags", "post /tags")
+
+
+def count_permutation_with_op(uncovered, op, seq, c_size, strength):
+    """the count of the original SCA, which scanned the uncovered permutations for each candidate"""
+    p_list = {p + (op,) for p in combinations(seq, c_size)}
+    if c_size == strength - 1:
+        return len(uncovered & p_list)
+    return sum(1 for uc in uncovered if uc[:(c_size + 1)] in p_list)
+
+
+class CheckedSCA(SCA):
+    """SCA checking its incremental scores against the original count before each choice"""
+
+    def __init__(self, strength, operations):
+        super().__init__(strength, operations)
+        self.reference = {p for p in permutations(self._operations, self._strength) if SemanticValidator.is_valid(p)}
+        self.sequence = list()
+        self.checked = 0
+
+    def _reset_scores(self):
+        super()._reset_scores()
+        self.sequence = list()
+
+    def _append(self, seq, op):
+        super()._append(seq, op)
+        self.sequence = seq
+
+    def _find_best(self, candidates, c_size):
+        for op in candidates:
+            expected = count_permutation_with_op(self.reference, op, self.sequence, c_size, self._strength)
+            assert self._scores[c_size][self._op_index[op]] == expected
+            self.checked += 1
+        return super()._find_best(candidates, c_size)
+
+    def _update_uncovered(self, sequence):
+        super()._update_uncovered(sequence)
+        self.reference -= set(combinations(sequence, self._strength))
+
+
+@pytest.mark.parametrize("strength", [1, 2, 3])
+def test_scores_match_the_original_count(operations, strength):
+    random.seed(strength)
+    sca = CheckedSCA(strength, operations)
+    for sequence in sca.sequences():
+        assert len(sequence) > 0
+        assert sca._remaining == len(sca.reference)
+    assert sca.checked > 0
+    assert sca.is_all_covered()
+    assert len(sca.reference) == 0
+
+
+def test_uncovered_codes_are_the_valid_permutations(operations):
+    sca = SCA(2, operations)
+    decoded = {(sca._operations[c // sca._base], sca._operations[c % sca._base]) for c in sca._uncovered.tolist()}
+    assert decoded == {p for p in permutations(operations, 2) if SemanticValidator.is_valid(p)}
+    # a post does not follow an operation on the resources it creates, a delete is not followed by them
+    post_users, get_user, delete_user = operations[0], operations[2], operations[4]
+    assert (get_user, post_users) not in decoded
+    assert (delete_user, get_user) not in decoded
+    assert (post_users, get_user) in decoded
+
+
+def test_sequences_start_with_the_dependent_posts(operations):
+    random.seed(0)
+    for sequence in SCA(2, operations).sequences():
+        for i, op in enumerate(sequence):
+            for post in operations:
+                if post.verb.value == "post" and post is not op and post.path.is_ancestor_of(op.path) \
+                        and post in sequence:
+                    assert sequence.index(post) < i
+
+
+@pytest.mark.parametrize("path, resource", [
+    ("/users", ("users",)),
+    ("/users/{id}", ("users",)),
+    ("/users/{id}/posts", ("users", "{}", "posts")),
+    ("/users/{id}/posts/{pid}", ("users", "{}", "posts")),
+    ("/", ()),
+])
+def test_resource_of(path, resource):
+    assert SequencePipeline.resource_of(RestOp(HOST, path, "get")) == resource
+
+
+@pytest.mark.parametrize("first, second, expected", [
+    # the same operation
+    (["post /users"], ["post /users"], True),
+    # both read the same resource
+    (["get /users"], ["get /users/{id}"], False),
+    # one writes what the other reads
+    (["post /users"], ["get /users/{id}"], True),
+    (["get /users/{id}/posts/{pid}"], ["delete /users/{id}"], True),
+    (["put /users/{id}"], ["get /users/{id}/posts/{pid}"], True),
+    # writes of unrelated resources
+    (["post /users", "delete /users/{id}"], ["post /tags", "get /tags"], False),
+    # writes of sibling resources under the same parent
+    (["post /users/{id}/posts"], ["post /users/{id}/comments"], False),
+])
+def test_conflicts(first, second, expected):
+    first, second = SequencePipeline.footprint_of(operations_of(*first)), \
+        SequencePipeline.footprint_of(operations_of(*second))
+    assert SequencePipeline.conflicts(first, second) is expected
+    assert SequencePipeline.conflicts(second, first) is expected
+
+
+class BuiltSCA:
+    """SCA which has built all sequences"""
+
+    @staticmethod
+    def is_all_covered():
+        return True
+
+
+def test_conflicting_sequences_are_not_tested_at_the_same_time():
+    # the shortest sequence is tested first
+    users = operations_of("post /users")
+    tags = operations_of("post /tags")
+    user_posts = operations_of("get /users/{id}", "get /users/{id}/posts/{pid}")
+    pipeline = SequencePipeline(BuiltSCA(), 4, 8, [users, user_posts, tags]).start()
+
+    first = pipeline.acquire()
+    second = pipeline.acquire()
+    assert first is users
+    # the posts of the users are read while the users are written
+    assert second is tags
+
+    acquired = list()
+    thread = threading.Thread(target=lambda: acquired.append(pipeline.acquire()))
+    thread.start()
+    thread.join(0.2)
+    assert thread.is_alive()
+    pipeline.release(first)
+    thread.join(5)
+    assert acquired == [user_posts]
+    assert pipeline.peak == 2
+
+    assert not pipeline.done
+    pipeline.release(second)
+    pipeline.release(user_posts)
+    assert pipeline.acquire() is None
+    assert pipeline.done
+    pipeline.close()
+
+
+def test_paused_pipeline_gives_the_untested_sequences():
+    sequences = [operations_of("post /users"), operations_of("post /tags"), operations_of("get /tags")]
+    pipeline = SequencePipeline(BuiltSCA(), 4, 8, sequences).start()
+    running = pipeline.acquire()
+    with pipeline.paused() as pending:
+        assert pending[0] is running
+        assert len(pending) == 3
+    pipeline.stop()
+    assert pipeline.acquire() is None
+    pipeline.close()
@@ -0,0 +1,100 @@
+import pytest
+
+from src.writer import JsonLinesWriter
+
+
+def nested(depth):
+    record = []
+    for _ in range(depth):
+        record = [record]
+    return record
+
+
+class BrokenFile:
+    """file failing the first write, e.g. a full disk"""
+
+    def __init__(self, file):
+        self._file = file
+        self.failures = 1
+
+    def write(self, text):
+        if self.failures > 0:
+            self.failures -= 1
+            raise OSError("no space left on device")
+        return self._file.write(text)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+@pytest.mark.parametrize("compress", ["none", "gzip"])
+def test_records_are_written_on_close(tmp_path, compress):
+    writer = JsonLinesWriter(tmp_path / "case.jsonl", compress, flush_interval=60)
+    for i in range(100):
+        writer.write({"i": i, "response": {"name": "é"}})
+    writer.close()
+    assert list(JsonLinesWriter.read(writer.path)) == [{"i": i, "response": {"name": "é"}} for i in range(100)]
+
+
+def test_records_are_written_on_flush(tmp_path):
+    writer = JsonLinesWriter(tmp_path / "case.jsonl", flush_interval=60)
+    writer.write({"i": 0})
+    writer.write({"i": 1})
+    writer.flush()
+    assert list(JsonLinesWriter.read(writer.path)) == [{"i": 0}, {"i": 1}]
+    writer.close()
+
+
+@pytest.mark.parametrize("compress", ["none", "gzip"])
+def test_each_run_appends_to_the_file(tmp_path, compress):
+    for i in range(2):
+        writer = JsonLinesWriter(tmp_path / "case.jsonl", compress)
+        writer.write({"run": i})
+        writer.close()
+    assert list(JsonLinesWriter.read(writer.path)) == [{"run": 0}, {"run": 1}]
+
+
+def test_record_which_cannot_be_serialized_is_dropped_alone(tmp_path):
+    class Unprintable:
+        def __str__(self):
+            raise ValueError("no str")
+
+    writer = JsonLinesWriter(tmp_path / "case.jsonl")
+    writer.write({"i": 0})
+    writer.write(nested(100000))
+    writer.write({"value": Unprintable()})
+    writer.write({"i": 1})
+    writer.flush()
+    assert writer._thread.is_alive()
+    writer.close()
+    assert list(JsonLinesWriter.read(writer.path)) == [{"i": 0}, {"i": 1}]
+
+
+def test_write_error_does_not_stop_the_writer(tmp_path):
+    writer = JsonLinesWriter(tmp_path / "case.jsonl", flush_interval=60)
+    writer._file = BrokenFile(writer._file)
+    writer.write({"i": 0})
+    # flush returns although the records could not be written
+    writer.flush()
+    assert writer._thread.is_alive()
+    writer.write({"i": 1})
+    writer.close()
+    assert list(JsonLinesWriter.read(writer.path)) == [{"i": 1}]
+
+
+def test_flush_and_close_return_when_the_thread_is_gone(tmp_path):
+    writer = JsonLinesWriter(tmp_path / "case.jsonl", flush_interval=0.1)
+    writer.write(None)
+    writer._thread.join(5)
+    assert not writer._thread.is_alive()
+    writer.write({"i": 0})
+    writer.flush()
+    writer.close()
+
+
+def test_unknown_compression_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="unknown compression"):
+        JsonLinesWriter(tmp_path / "case.jsonl", "bz2")